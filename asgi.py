@@ -0,0 +1,144 @@
+"""ASGI entry point for serving many slow clients from a single process.
+
+    pip install uvicorn a2wsgi
+    uvicorn asgi:app --host 0.0.0.0 --port 8000
+
+The Flask views stay synchronous and run on a bounded thread pool
+(ASGI_THREADS), while the event loop does all of the network I/O. Request
+bodies are read in full before a thread is taken, so a phone trickling a photo
+upload over a rural link costs a coroutine rather than a worker, and responses
+are queued so the thread is released before a slow client has drained them.
+Live task updates (/projects/<pid>/events) are served natively on the loop and
+hold no thread while the connection stays open.
+"""
+import io
+import os
+import re
+import asyncio
+from tempfile import SpooledTemporaryFile
+from a2wsgi import WSGIMiddleware
+from a2wsgi.wsgi import build_environ
+from werkzeug.exceptions import NotFound
+
+import index
+
+ASGI_THREADS = int(os.getenv("ASGI_THREADS", "32"))
+BODY_CHUNK = 64 * 1024
+BODY_SPOOL_BYTES = 1024 * 1024  # larger bodies are buffered in UPLOAD_TMP_FOLDER
+SEND_QUEUE_SIZE = 256  # response chunks queued per request before the view thread waits
+EVENTS_PATH = re.compile(r"^/projects/([^/]+)/events$")
+
+wsgi = WSGIMiddleware(index.app, workers=ASGI_THREADS, send_queue_size=SEND_QUEUE_SIZE)
+index.ASYNC_EVENTS = True  # dashboards may subscribe; see project_events below
+
+
+async def respond(send, status, body=b"", headers=()):
+    await send({"type": "http.response.start", "status": status,
+                "headers": [(b"content-type", b"text/plain; charset=utf-8"), *headers]})
+    await send({"type": "http.response.body", "body": body})
+
+
+async def read_body(receive, limit):
+    """Buffer the request body on the loop.
+
+    Returns the rewound file, None if the client went away, or False if the
+    body is larger than ``limit``.
+    """
+    index.ensure_upload_dirs()
+    body = SpooledTemporaryFile(max_size=BODY_SPOOL_BYTES, dir=index.UPLOAD_TMP_FOLDER)
+    size = 0
+    more = True
+    while more:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            body.close()
+            return None
+        chunk = message.get("body", b"")
+        size += len(chunk)
+        if limit and size > limit:
+            body.close()
+            return False
+        body.write(chunk)
+        more = message.get("more_body", False)
+    body.seek(0)
+    return body
+
+
+async def buffered_request(scope, receive, send):
+    limit = index.app.config.get("MAX_CONTENT_LENGTH")
+    length = dict(scope["headers"]).get(b"content-length", b"")
+    if limit and length.isdigit() and int(length) > limit:
+        return await respond(send, 413, b"Request Entity Too Large")
+    body = await read_body(receive, limit)
+    if body is None:
+        return
+    if body is False:
+        return await respond(send, 413, b"Request Entity Too Large")
+
+    replayed = False
+
+    async def replay():
+        nonlocal replayed
+        if replayed:
+            return await receive()  # body already handed over; wait for the disconnect
+        chunk = body.read(BODY_CHUNK)
+        replayed = len(chunk) < BODY_CHUNK
+        return {"type": "http.request", "body": chunk, "more_body": not replayed}
+
+    try:
+        await wsgi(scope, replay, send)
+    finally:
+        body.close()
+
+
+def authorize_events(environ, pid):
+    with index.app.request_context(environ):
+        try:
+            return index.event_stream_key(pid)
+        except NotFound:
+            return None
+
+
+async def wait_disconnect(receive):
+    while (await receive())["type"] != "http.disconnect":
+        pass
+
+
+async def project_events(scope, receive, send, pid):
+    loop = asyncio.get_running_loop()
+    environ = build_environ(scope, io.BytesIO())
+    # Session lookup and the ownership query are blocking; run them on the pool
+    key = await loop.run_in_executor(wsgi.executor, authorize_events, environ, pid)
+    if key is None:
+        return await respond(send, 404, b"Not Found")
+
+    q = index.broker.subscribe_async(key, loop)
+    disconnected = asyncio.ensure_future(wait_disconnect(receive))
+    try:
+        headers = [(b"content-type", b"text/event-stream; charset=utf-8")]
+        headers += [(k.lower().encode("latin1"), v.encode("latin1")) for k, v in index.SSE_HEADERS.items()]
+        await send({"type": "http.response.start", "status": 200, "headers": headers})
+        await send({"type": "http.response.body", "body": ("retry: 5000\n\n" + index.sse_clock()).encode(), "more_body": True})
+        deadline = loop.time() + index.SSE_MAX_SECONDS
+        rollover_at = index.next_day_start()
+        while loop.time() < deadline and not disconnected.done():
+            try:
+                chunk = index.sse(await asyncio.wait_for(q.get(), index.sse_wait(rollover_at)))
+            except asyncio.TimeoutError:
+                chunk, rollover_at = index.sse_idle(rollover_at)
+            await send({"type": "http.response.body", "body": chunk.encode(), "more_body": True})
+        if not disconnected.done():
+            await send({"type": "http.response.body", "body": b""})
+    finally:
+        disconnected.cancel()
+        index.broker.unsubscribe(key, q)
+
+
+async def app(scope, receive, send):
+    if scope["type"] == "http":
+        match = EVENTS_PATH.match(scope["path"])
+        if match and scope["method"] == "GET":
+            return await project_events(scope, receive, send, match.group(1))
+        if scope["method"] in ("POST", "PUT", "PATCH"):
+            return await buffered_request(scope, receive, send)
+    await wsgi(scope, receive, send)
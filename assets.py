@@ -0,0 +1,248 @@
+"""Static asset pipeline: bundling, minification, fingerprinting and precompression.
+
+    python assets.py        # writes static/dist/ and static/dist/manifest.json
+
+Templates refer to assets by source name (``asset_url('css/agro.css')``) or
+bundle name (``asset_tags('js/home.js')``). After a build those resolve to
+fingerprinted files under static/dist, served with immutable cache headers
+(and as .br/.gz when the client accepts it); without a build they fall back to
+the plain files in static/, so development needs no build step.
+
+Only assets the templates reference are built. Files referenced from CSS
+(fonts, background images) are fingerprinted and rewritten too, and images are
+downscaled and re-encoded on the way. Minification and .br output need rcssmin,
+rjsmin and brotli, listed in requirements-build.txt; without them the build
+still runs, but only concatenates JS and writes .gz files (and says so).
+
+Deploying: static/dist is build output and is not committed, and the
+@vercel/python build in vercel.json doesn't run this script, so build from
+the checkout that gets deployed, e.g. in CI:
+
+    pip install -r requirements-build.txt && python assets.py && vercel deploy --prod
+
+The Vercel CLI uploads the built files along with the code (.vercelignore
+leaves static/dist in). Deploys made straight from the git integration skip
+the build; they still work, but serve the plain static/ files without
+fingerprints, long-lived caching or precompression, and log a warning on
+first use.
+"""
+import os
+import re
+import io
+import sys
+import json
+import gzip
+import shutil
+import hashlib
+import posixpath
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+STATIC_DIR = os.path.join(ROOT, "static")
+DIST_DIR = os.path.join(STATIC_DIR, "dist")
+MANIFEST_PATH = os.path.join(DIST_DIR, "manifest.json")
+TEMPLATE_DIR = os.path.join(ROOT, "templates")
+
+# Bundles are concatenated in order; keep the order the pages loaded them in
+BUNDLES = {
+    "css/vendor.css": ["css/bootstrap.min.css", "css/bootstrap-icons.css", "css/templatemo-tiya-golf-club.css"],
+    "js/home.js": ["js/jquery.min.js", "js/bootstrap.bundle.min.js", "js/jquery.sticky.js", "js/click-scroll.js",
+                   "js/animated-headline.js", "js/modernizr.js", "js/custom.js"],
+}
+# Icon rules (.bi-foo::before) are dropped unless a template or script names the icon
+PURGE_PREFIXES = {"css/bootstrap-icons.css": "bi-"}
+IMAGE_MAX_WIDTH = 1920
+JPEG_QUALITY = 80
+COMPRESS_EXTS = {".css", ".js", ".svg", ".json", ".txt"}  # fonts and photos are already compressed
+COMPRESS_MIN_BYTES = 1024
+
+ASSET_REF_RE = re.compile(r"""asset_(url|tags)\(\s*['"]([^'"]+)['"]""")
+CSS_URL_RE = re.compile(r"""url\(\s*(['"]?)([^'")]+)\1\s*\)""")
+
+
+def load_manifest():
+    """Logical name -> built path under static/dist; empty when not built."""
+    try:
+        with open(MANIFEST_PATH) as f:
+            return json.load(f)["files"]
+    except (OSError, ValueError, KeyError):
+        return {}
+
+
+def minify_css(text):
+    try:
+        import rcssmin
+        return rcssmin.cssmin(text)
+    except ImportError:
+        pass
+    text = re.sub(r"/\*.*?\*/", "", text, flags=re.S)
+    text = re.sub(r"\s+", " ", text)
+    text = re.sub(r"\s*([{};,>])\s*", r"\1", text)
+    text = re.sub(r":\s+", ":", text)
+    return text.replace(";}", "}").strip()
+
+
+def minify_js(text):
+    try:
+        import rjsmin
+        return rjsmin.jsmin(text)
+    except ImportError:
+        return text.strip()  # a regex can't minify JS safely; gzip/brotli still apply
+
+
+def purge_rules(css, prefix, used):
+    pattern = re.compile(r"\.(" + re.escape(prefix) + r"[\w-]+)::?before\s*\{[^}]*\}\s*")
+    return pattern.sub(lambda m: m.group(0) if m.group(1) in used else "", css)
+
+
+def reencode_image(path, data):
+    """Downscale and re-encode JPEG/PNG; keeps the original when that is smaller."""
+    ext = os.path.splitext(path)[1].lower()
+    if ext not in (".jpg", ".jpeg", ".png"):
+        return data
+    try:
+        from PIL import Image
+    except ImportError:
+        return data
+    with Image.open(io.BytesIO(data)) as img:
+        if img.width > IMAGE_MAX_WIDTH:
+            img = img.resize((IMAGE_MAX_WIDTH, round(img.height * IMAGE_MAX_WIDTH / img.width)), Image.LANCZOS)
+        out = io.BytesIO()
+        if ext == ".png":
+            img.save(out, "PNG", optimize=True)
+        else:
+            img.convert("RGB").save(out, "JPEG", quality=JPEG_QUALITY, optimize=True, progressive=True)
+    return out.getvalue() if out.tell() < len(data) else data
+
+
+class Builder:
+    def __init__(self, used_tokens):
+        self.used_tokens = used_tokens
+        self.manifest = {}
+        self.stats = []
+
+    def emit(self, name, data):
+        """Write ``data`` under a content-hashed name (plus compressed copies)."""
+        stem, ext = posixpath.splitext(name)
+        built = f"{stem}.{hashlib.sha256(data).hexdigest()[:10]}{ext}"
+        path = os.path.join(DIST_DIR, *built.split("/"))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(data)
+        sizes = {"raw": len(data)}
+        if ext in COMPRESS_EXTS and len(data) >= COMPRESS_MIN_BYTES:
+            with open(path + ".gz", "wb") as f:
+                f.write(gzip.compress(data, compresslevel=9, mtime=0))
+            sizes["gzip"] = os.path.getsize(path + ".gz")
+            try:
+                import brotli
+            except ImportError:
+                brotli = None
+            if brotli is not None:
+                with open(path + ".br", "wb") as f:
+                    f.write(brotli.compress(data, quality=11))
+                sizes["br"] = os.path.getsize(path + ".br")
+        self.manifest[name] = built
+        self.stats.append((name, built, sizes))
+        return built
+
+    def read(self, name):
+        with open(os.path.join(STATIC_DIR, *name.split("/")), "rb") as f:
+            return f.read()
+
+    def css_source(self, name, out_name):
+        """Source CSS with purging applied and url()s pointing at built files."""
+        css = self.read(name).decode("utf-8")
+        if name in PURGE_PREFIXES:
+            css = purge_rules(css, PURGE_PREFIXES[name], self.used_tokens)
+
+        def rewrite(match):
+            quote, ref = match.groups()
+            if re.match(r"^(data:|[a-z]+:|//|/|#)", ref):
+                return match.group(0)
+            target = posixpath.normpath(posixpath.join(posixpath.dirname(name), ref.split("?")[0].split("#")[0]))
+            if not os.path.exists(os.path.join(STATIC_DIR, *target.split("/"))):
+                return match.group(0)
+            built = self.file(target)
+            return f"url({quote}{posixpath.relpath(built, posixpath.dirname(out_name))}{quote})"
+
+        return CSS_URL_RE.sub(rewrite, css)
+
+    def file(self, name):
+        if name in self.manifest:
+            return self.manifest[name]
+        ext = posixpath.splitext(name)[1].lower()
+        if ext == ".css":
+            data = minify_css(self.css_source(name, name)).encode("utf-8")
+        elif ext == ".js":
+            data = minify_js(self.read(name).decode("utf-8")).encode("utf-8")
+        else:
+            data = reencode_image(name, self.read(name))
+        return self.emit(name, data)
+
+    def bundle(self, name):
+        # Built paths keep their directory, so bundles live next to their sources
+        parts = BUNDLES[name]
+        if name.endswith(".css"):
+            data = "\n".join(minify_css(self.css_source(part, name)) for part in parts)
+        else:
+            data = "\n;".join(minify_js(self.read(part).decode("utf-8")) for part in parts)
+        return self.emit(name, data.encode("utf-8"))
+
+
+def template_refs():
+    """(asset names, bundle names, template text) referenced by the templates."""
+    files, bundles, texts = set(), set(), []
+    for entry in sorted(os.listdir(TEMPLATE_DIR)):
+        with open(os.path.join(TEMPLATE_DIR, entry), encoding="utf-8") as f:
+            text = f.read()
+        texts.append(text)
+        for kind, name in ASSET_REF_RE.findall(text):
+            (bundles if kind == "tags" and name in BUNDLES else files).add(name)
+    return files, bundles, "\n".join(texts)
+
+
+def build():
+    files, bundles, text = template_refs()
+    for name in bundles:
+        for part in BUNDLES[name]:
+            if part.endswith(".js"):
+                text += "\n" + open(os.path.join(STATIC_DIR, *part.split("/")), encoding="utf-8").read()
+    used_tokens = set(re.findall(r"[\w-]+", text))
+
+    shutil.rmtree(DIST_DIR, ignore_errors=True)
+    builder = Builder(used_tokens)
+    for name in sorted(bundles):
+        builder.bundle(name)
+    for name in sorted(files):
+        builder.file(name)
+    with open(MANIFEST_PATH, "w") as f:
+        json.dump({"files": builder.manifest}, f, indent=2, sort_keys=True)
+    return builder
+
+
+def missing_build_tools():
+    missing = []
+    for module in ("rjsmin", "rcssmin", "brotli"):
+        try:
+            __import__(module)
+        except ImportError:
+            missing.append(module)
+    return missing
+
+
+def main():
+    missing = missing_build_tools()
+    if missing:
+        print(f"warning: {', '.join(missing)} not installed; assets won't be fully minified/precompressed "
+              "(pip install -r requirements-build.txt)", file=sys.stderr)
+    builder = build()
+    for name, built, sizes in builder.stats:
+        source = BUNDLES.get(name, [name])
+        before = sum(os.path.getsize(os.path.join(STATIC_DIR, *p.split("/"))) for p in source)
+        extra = "  ".join(f"{k} {v / 1024:.1f} KB" for k, v in sizes.items() if k != "raw")
+        print(f"{name:>28} -> {built:<40} {before / 1024:8.1f} KB -> {sizes['raw'] / 1024:8.1f} KB  {extra}")
+    print(f"wrote {len(builder.manifest)} assets and {os.path.relpath(MANIFEST_PATH, ROOT)}")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
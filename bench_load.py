@@ -0,0 +1,274 @@
+"""Load benchmark: seeds a database and drives the hot routes with concurrent clients.
+
+Runs in-process against index.app with one test client per simulated user,
+so no server is needed. Point it at a throwaway database:
+
+    MONGO_URI=mongodb://localhost:27017 python bench_load.py --db bench_farmer
+    python bench_load.py --mongomock --users 100 --concurrency 4   # pip install mongomock
+
+Reports throughput, latency percentiles and DB calls (collection operations)
+per request for each scenario, and exits non-zero when a p95 budget is
+exceeded:
+
+    python bench_load.py --mongomock --budget dashboard=50 --budget admin_search=120
+
+mongomock lacks the date operators used by the dashboard's day-rollover
+update, so with --mongomock that update is replaced by a no-op and the
+dashboard numbers exclude it. Use a real MongoDB for release decisions.
+"""
+import io
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import datetime
+import tempfile
+import statistics
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+REPO = os.path.dirname(os.path.abspath(__file__))
+SCENARIOS = ("projects", "dashboard", "tasks_save", "admin_search", "upload")
+PHOTO_SIZE = (320, 240)
+
+_calls = threading.local()
+
+
+def load_app(args):
+    """Import index against the benchmark database, with uploads in a temp dir."""
+    if args.mongomock:
+        import mongomock
+        import pymongo
+        pymongo.MongoClient = mongomock.MongoClient
+    os.environ["MONGO_DB"] = args.db
+    os.environ.setdefault("UPLOAD_GC_INTERVAL", "0")
+    os.chdir(tempfile.mkdtemp(prefix="bench_load_"))
+    sys.path.insert(0, REPO)
+    import index
+
+    if args.mongomock:
+        index.dashboard_refresh_pipeline = lambda today: [{"$set": {"bench_seen": today}}]
+
+    # Count collection operations per request (per thread, since the test
+    # client runs each request on the calling thread)
+    resolve = index.LazyCollection.__getattr__
+
+    def counted(self, attr):
+        target = resolve(self, attr)
+        if not callable(target):
+            return target
+
+        def call(*a, **kw):
+            _calls.count = getattr(_calls, "count", 0) + 1
+            return target(*a, **kw)
+        return call
+
+    index.LazyCollection.__getattr__ = counted
+    return index
+
+
+def seed(index, args, rng):
+    """Users, projects, weight history and past task events with photo names."""
+    db = index.get_mongo()[index.MONGO_DB]
+    for name in ("users", "photo_blobs", "app_meta"):
+        db.drop_collection(name)
+    for coll in index.TENANT_COLLECTIONS:
+        for shard in coll.shards():
+            shard.drop()
+    password = index.bcrypt.hashpw(b"bench", index.bcrypt.gensalt(4))
+    users = [{"_id": index.ObjectId(), "email": f"user{i}@bench.test", "name": f"Farmer {i}",
+              "name_lc": f"farmer {i}", "role": "user", "password": password} for i in range(args.users)]
+    admin = {"_id": index.ObjectId(), "email": "admin@bench.test", "name": "Admin", "name_lc": "admin",
+             "role": "admin", "password": password}
+    db.users.insert_many(users + [admin])
+
+    now = datetime.datetime.utcnow()
+    projects, events, weights = [], [], []
+    for user in users:
+        for j in range(args.projects_per_user):
+            animal = rng.choice(["cow", "goat"])
+            weight = round(rng.uniform(150, 450) if animal == "cow" else rng.uniform(8, 30), 1)
+            purchase = (now - datetime.timedelta(days=rng.randint(1, 200))).date().isoformat()
+            name = f"{animal.title()} {user['name']} {j}"
+            projects.append({
+                "_id": index.ObjectId(), "owner": str(user["_id"]), "name": name, "name_lc": name.lower(),
+                "type": animal, "purchase_date": purchase, "today": now.date().isoformat(), "weight": weight,
+                "feed_level": index.feed_level(weight, animal), "target": weight + 120 if animal == "cow" else 24,
+                "check_period": 30 if animal == "cow" else 1, "updated_at": now,
+            })
+    insert_by_shard(index, index.proj_col, projects)
+    for proj in projects:
+        tasks = index.schedule_task_count(proj["weight"], proj["type"])
+        for d in range(args.history_days):
+            day = (now - datetime.timedelta(days=d)).date().isoformat()
+            for t in range(tasks):
+                photos = [f"{rng.getrandbits(256):064x}.jpg"] if rng.random() < 0.6 else []
+                events.append({"owner": proj["owner"], "project_id": proj["_id"], "date": day, "task_idx": str(t),
+                               "done": bool(photos), "photos": photos})
+            weights.append({"owner": proj["owner"], "project_id": proj["_id"], "weight": proj["weight"] - d * 0.8,
+                            "at": now - datetime.timedelta(days=d), "source": "bench"})
+    insert_by_shard(index, index.events_col, events)
+    insert_by_shard(index, index.weights_col, weights)
+    index.migrate()
+    return users, admin, projects
+
+
+def insert_by_shard(index, coll, docs):
+    """Insert tenant documents on the shard of their owner (see MONGO_SHARDS)."""
+    groups = {}
+    for doc in docs:
+        groups.setdefault(index.owner_shard(doc["owner"]), []).append(doc)
+    for shard, group in groups.items():
+        for i in range(0, len(group), 10000):
+            coll.on(shard).insert_many(group[i:i + 10000])
+
+
+def photo_bytes(rng):
+    try:
+        from PIL import Image
+    except ImportError:
+        return b"\xff\xd8\xff" + rng.randbytes(20000)
+    img = Image.frombytes("RGB", PHOTO_SIZE, rng.randbytes(PHOTO_SIZE[0] * PHOTO_SIZE[1] * 3))
+    buf = io.BytesIO()
+    img.save(buf, "JPEG", quality=85)
+    return buf.getvalue()
+
+
+class Clients:
+    """One logged-in test client per user, per thread."""
+
+    def __init__(self, app):
+        self.app = app
+        self.local = threading.local()
+
+    def get(self, user):
+        clients = self.local.__dict__.setdefault("clients", {})
+        client = clients.get(user["_id"])
+        if client is None:
+            client = clients[user["_id"]] = self.app.test_client()
+            with client.session_transaction() as sess:
+                sess["user_id"] = str(user["_id"])
+                sess["role"] = user["role"]
+        return client
+
+
+def make_request(scenario, clients, users, admin, projects, by_owner, rng):
+    if scenario == "projects":
+        user = rng.choice(users)
+        return clients.get(user).get("/projects")
+    if scenario == "admin_search":
+        term = rng.choice(["cow", "goat", "farmer 1", "co", "farmer"])
+        return clients.get(admin).get("/admin/dashboard", query_string={"search": term})
+    user = rng.choice(users)
+    proj = rng.choice(by_owner[str(user["_id"])])
+    client = clients.get(user)
+    if scenario == "dashboard":
+        return client.get(f"/projects/{proj['_id']}/dashboard")
+    if scenario == "tasks_save":
+        done = [str(i) for i in range(4) if rng.random() < 0.5]
+        return client.post(f"/projects/{proj['_id']}/tasks/save", data={"done": done})
+    if scenario == "upload":
+        data = {"task_idx": str(rng.randint(0, 3)), "photos": (io.BytesIO(photo_bytes(rng)), "photo.jpg")}
+        return client.post(f"/projects/{proj['_id']}/photos/upload", data=data, content_type="multipart/form-data")
+    raise ValueError(scenario)
+
+
+def run_scenario(scenario, index, seeded, args):
+    users, admin, projects = seeded
+    by_owner = {}
+    for proj in projects:
+        by_owner.setdefault(proj["owner"], []).append(proj)
+    clients = Clients(index.app)
+
+    def one(i):
+        rng = random.Random(args.seed * 100003 + i)
+        _calls.count = 0
+        start = time.perf_counter()
+        response = make_request(scenario, clients, users, admin, projects, by_owner, rng)
+        elapsed = time.perf_counter() - start
+        return elapsed, _calls.count, response.status_code
+
+    for i in range(args.warmup):
+        one(-1 - i)
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        results = list(pool.map(one, range(args.requests)))
+    wall = time.perf_counter() - started
+
+    latencies = sorted(r[0] * 1000 for r in results)
+    errors = sum(1 for r in results if r[2] >= 400)
+
+    def pct(p):
+        return latencies[min(len(latencies) - 1, int(p / 100 * len(latencies)))]
+
+    return {
+        "scenario": scenario,
+        "requests": len(results),
+        "errors": errors,
+        "rps": round(len(results) / wall, 1),
+        "p50_ms": round(pct(50), 2),
+        "p95_ms": round(pct(95), 2),
+        "p99_ms": round(pct(99), 2),
+        "max_ms": round(latencies[-1], 2),
+        "db_calls_per_request": round(statistics.mean(r[1] for r in results), 2),
+    }
+
+
+def parse_budgets(values):
+    budgets = {}
+    for value in values:
+        name, _, ms = value.partition("=")
+        if name not in SCENARIOS or not ms:
+            raise SystemExit(f"bad --budget {value!r}; expected <scenario>=<p95 ms>")
+        budgets[name] = float(ms)
+    return budgets
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--mongomock", action="store_true", help="use mongomock instead of MONGO_URI")
+    parser.add_argument("--db", default="bench_farmer", help="database to seed (dropped and recreated)")
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--projects-per-user", type=int, default=5)
+    parser.add_argument("--history-days", type=int, default=14)
+    parser.add_argument("--requests", type=int, default=300, help="requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--warmup", type=int, default=10)
+    parser.add_argument("--scenario", action="append", choices=SCENARIOS, help="repeatable; default all")
+    parser.add_argument("--budget", action="append", default=[], help="<scenario>=<p95 ms>, repeatable")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args()
+    budgets = parse_budgets(args.budget)
+
+    index = load_app(args)
+    rng = random.Random(args.seed)
+    t0 = time.perf_counter()
+    seeded = seed(index, args, rng)
+    seed_seconds = time.perf_counter() - t0
+
+    results = [run_scenario(s, index, seeded, args) for s in (args.scenario or SCENARIOS)]
+    ok = True
+    for row in results:
+        budget = budgets.get(row["scenario"])
+        row["budget_p95_ms"] = budget
+        row["within_budget"] = budget is None or row["p95_ms"] <= budget
+        ok = ok and row["within_budget"] and not row["errors"]
+
+    if args.json:
+        print(json.dumps({"seed_seconds": round(seed_seconds, 2), "results": results}, indent=2))
+    else:
+        print(f"seeded {len(seeded[0])} users / {len(seeded[2])} projects in {seed_seconds:.1f}s "
+              f"({'mongomock' if args.mongomock else os.getenv('MONGO_URI', 'mongodb://localhost:27017')})")
+        print(f"{'scenario':>14} {'req/s':>8} {'p50':>8} {'p95':>8} {'p99':>8} {'max':>8} {'db/req':>7} {'errors':>6}")
+        for row in results:
+            flag = "" if row["within_budget"] else f"  OVER BUDGET ({row['budget_p95_ms']:.0f} ms)"
+            print(f"{row['scenario']:>14} {row['rps']:>8.1f} {row['p50_ms']:>8.2f} {row['p95_ms']:>8.2f} "
+                  f"{row['p99_ms']:>8.2f} {row['max_ms']:>8.2f} {row['db_calls_per_request']:>7.2f} {row['errors']:>6}{flag}")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
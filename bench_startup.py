@@ -0,0 +1,69 @@
+"""Cold-start benchmark: import time of index.py and latency of the first request.
+
+Each run uses a fresh interpreter, like a new serverless instance would:
+
+    python bench_startup.py --runs 5 --path /projects --import-budget-ms 800 --first-request-budget-ms 1500
+
+The default probe is a logged-in /projects, so the first request pays for
+what a real cold start does: the MongoDB connection, a query and a template
+render. It needs a reachable MONGO_URI; the user id only has to be well
+formed. Exits non-zero when the median of either measurement exceeds its
+budget or when any request fails with a 5xx status.
+"""
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+
+PROBE = r"""
+import json, sys, time
+t0 = time.perf_counter()
+import index
+t1 = time.perf_counter()
+client = index.app.test_client()
+if sys.argv[2]:
+    with client.session_transaction() as sess:
+        sess["user_id"] = sys.argv[2]
+        sess["role"] = "user"
+    t1 = time.perf_counter()  # session setup isn't part of the request
+response = client.get(sys.argv[1])
+t2 = time.perf_counter()
+print(json.dumps({"import_ms": (t1 - t0) * 1000, "first_request_ms": (t2 - t1) * 1000, "status": response.status_code}))
+"""
+
+def run_once(path, user_id):
+    out = subprocess.run(
+        [sys.executable, "-c", PROBE, path, user_id],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        capture_output=True, text=True, check=True,
+    )
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--path", default="/projects")
+    parser.add_argument("--user-id", default="000000000000000000000000",
+                        help="session user for the probe; empty for an anonymous request")
+    parser.add_argument("--import-budget-ms", type=float, default=800)
+    parser.add_argument("--first-request-budget-ms", type=float, default=1500)
+    args = parser.parse_args()
+
+    samples = [run_once(args.path, args.user_id) for _ in range(args.runs)]
+    ok = True
+    for key, budget in (("import_ms", args.import_budget_ms), ("first_request_ms", args.first_request_budget_ms)):
+        values = [s[key] for s in samples]
+        median = statistics.median(values)
+        within = median <= budget
+        ok = ok and within
+        print(f"{key:>18}: min {min(values):8.1f}  median {median:8.1f}  max {max(values):8.1f}  "
+              f"budget {budget:8.1f}  {'OK' if within else 'OVER BUDGET'}")
+    statuses = sorted({s["status"] for s in samples})
+    failed = [status for status in statuses if status >= 500]
+    print(f"{'status codes':>18}: {statuses}{'  FAILED' if failed else ''}")
+    sys.exit(0 if ok and not failed else 1)
+
+if __name__ == "__main__":
+    main()
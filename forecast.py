@@ -0,0 +1,62 @@
+"""Batch weight-growth forecasting with NumPy.
+
+Readings for every animal are passed as flat arrays (one entry per reading,
+tagged with the animal's index), so the whole herd is fitted with a handful of
+vectorized passes instead of a Python loop per animal.
+"""
+import numpy as np
+
+
+def fit_growth(animal_idx, days, weights, n_animals, default_gain, half_life=30.0):
+    """Recency-weighted linear fit of weight against time for each animal.
+
+    ``days`` are relative to now (<= 0 for past readings). Returns
+    ``(gain_per_day, weight_now)`` arrays of length ``n_animals``. Animals with
+    fewer than two distinct reading days keep ``default_gain`` (scalar or per
+    animal array); animals without readings get NaN for ``weight_now``.
+    """
+    animal_idx = np.asarray(animal_idx, dtype=np.intp)
+    days = np.asarray(days, dtype=float)
+    weights = np.asarray(weights, dtype=float)
+    a = np.power(0.5, -days / half_life)
+
+    def total(values):
+        return np.bincount(animal_idx, weights=values, minlength=n_animals)
+
+    A = total(a)
+    T = total(a * days)
+    W = total(a * weights)
+    TT = total(a * days * days)
+    TW = total(a * days * weights)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        denom = A * TT - T * T
+        fitted = np.abs(denom) > 1e-9 * np.maximum(A * A, 1.0)
+        gain = np.where(fitted, (A * TW - T * W) / np.where(fitted, denom, 1.0),
+                        np.broadcast_to(default_gain, A.shape))
+        weight_now = np.where(A > 0, (W - gain * T) / np.where(A > 0, A, 1.0), np.nan)
+    return gain, weight_now
+
+
+def days_until(weight_now, gain, goal):
+    """Days until each animal reaches ``goal``: 0 if already there, inf if never."""
+    weight_now = np.asarray(weight_now, dtype=float)
+    goal = np.broadcast_to(np.asarray(goal, dtype=float), weight_now.shape)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        days = np.where(gain > 0, (goal - weight_now) / gain, np.inf)
+    return np.where(weight_now >= goal, 0.0, days)
+
+
+def next_threshold(weight_now, thresholds):
+    """Next feed-level boundary above each weight.
+
+    ``thresholds`` are the sorted weight limits of one animal type (level N
+    applies below the N-th limit). Returns ``(next_level, boundary)``; animals
+    already on the top level get level 0 and an infinite boundary.
+    """
+    limits = np.asarray(thresholds, dtype=float)
+    pos = np.searchsorted(limits, weight_now, side="right")
+    top = pos >= len(limits)
+    boundary = np.where(top, np.inf, limits[np.minimum(pos, len(limits) - 1)] if len(limits) else np.inf)
+    next_level = np.where(top, 0, pos + 2)
+    return next_level, boundary
@@ -1,15 +1,75 @@
+import io
+import asyncio
 import os
+import re
+import csv
+import math
 import bcrypt
+import time
+import queue
 import logging
+import tempfile
+import threading
+import json
+import base64
+import hashlib
+import secrets
 import datetime
+import mimetypes
+import click
 from datetime import date
 from bson import ObjectId, errors as bson_errors
-from werkzeug.utils import secure_filename
-from flask import Flask, request, session, redirect, url_for, render_template, flash
-from pymongo import MongoClient
-from functools import wraps
-from flask import abort
-from flask import current_app
+from werkzeug.exceptions import TooManyRequests
+from concurrent.futures import ThreadPoolExecutor
+from flask import Flask, Request, request, session, redirect, url_for, render_template, flash
+from pymongo import MongoClient, ASCENDING, DESCENDING, HASHED, ReturnDocument, UpdateOne, UpdateMany
+from pymongo.errors import DuplicateKeyError, BulkWriteError, OperationFailure
+from pymongo.read_preferences import Primary, PrimaryPreferred, Secondary, SecondaryPreferred, Nearest
+from urllib.parse import urlsplit
+from functools import wraps, lru_cache
+import assets
+from flask import abort, send_from_directory, jsonify, Response
+from flask import current_app, make_response, has_request_context, before_render_template, template_rendered
+from flask.sessions import SessionInterface, SessionMixin
+from flask.json.tag import TaggedJSONSerializer
+from itsdangerous import Signer, BadSignature
+from werkzeug.datastructures import CallbackDict
+from markupsafe import Markup, escape
+
+# Never load password hashes unless checking a password
+USER_PUBLIC_FIELDS = {"password": 0}
+
+# Per-process cache of the logged-in user (without password), so admin pages
+# don't pay a users lookup on every navigation. Role changes made through
+# set_user_role() invalidate it; changes made directly in the DB show up
+# within PRINCIPAL_CACHE_TTL seconds.
+PRINCIPAL_CACHE_TTL = float(os.getenv("PRINCIPAL_CACHE_TTL", "60"))
+PRINCIPAL_CACHE_SIZE = 1024
+_principal_cache = {}
+_principal_lock = threading.Lock()
+
+def get_principal(user_id):
+    now = time.monotonic()
+    cached = _principal_cache.get(user_id)
+    if cached and cached[0] > now:
+        return cached[1]
+    try:
+        user = users_col.find_one({"_id": ObjectId(user_id)}, USER_PUBLIC_FIELDS)
+    except (bson_errors.InvalidId, TypeError):
+        return None
+    with _principal_lock:
+        if len(_principal_cache) >= PRINCIPAL_CACHE_SIZE:
+            _principal_cache.clear()
+        _principal_cache[user_id] = (now + PRINCIPAL_CACHE_TTL, user)
+    return user
+
+def invalidate_principal(user_id):
+    with _principal_lock:
+        _principal_cache.pop(str(user_id), None)
+
+def set_user_role(user_id, role):
+    users_col.update_one({"_id": ObjectId(user_id)}, {"$set": {"role": role}})
+    invalidate_principal(user_id)
 
 def admin_required(f):
     @wraps(f)
@@ -18,39 +78,865 @@ def admin_required(f):
         if not user_id:
             flash("Login required", "warning")
             return redirect(url_for('home'))
-        try:
-            user_obj_id = ObjectId(user_id)
-        except bson_errors.InvalidId:
-            abort(403)
-        user = users_col.find_one({"_id": user_obj_id})
-        if not user or user.get("role") != "admin":
+        # Only the (cached) user record decides; the role copied into the
+        # session at login is refreshed from it, so a promotion through
+        # set_user_role() works without logging in again.
+        user = get_principal(user_id)
+        role = user.get("role") if user else None
+        if role and session.get('role') != role:
+            session['role'] = role
+        if role != "admin":
             abort(403)  # Forbidden access if not admin
         return f(*args, **kwargs)
     return decorated_function
 
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # thumbnails are optional; pages fall back to originals
+    Image = None
+
+class UploadRequest(Request):
+    """Stream uploaded file parts straight into the uploads temp dir.
+
+    Werkzeug's form parser writes each chunk into the stream returned here, so
+    a large photo is never held in memory and saving it is just a rename.
+    """
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        ensure_upload_dirs()
+        stream = tempfile.NamedTemporaryFile(dir=UPLOAD_TMP_FOLDER, prefix="upload_", delete=False)
+        self.__dict__.setdefault("upload_tmp_files", []).append(stream.name)
+        return stream
+
 # Logging setup
 logging.basicConfig(level=logging.INFO)
 
 # Flask app setup
 app = Flask(__name__)
+app.request_class = UploadRequest
 app.secret_key = os.getenv("SECRET_KEY", "your_secret_key")
 
-# MongoDB setup
-mongo = MongoClient(os.getenv("MONGO_URI", "mongodb://localhost:27017"))
-db = mongo["mydatabase"]
-users_col = db["users"]
-proj_col = db["projects"]
+# Metrics (METRICS=1): per-route latency, MongoDB round trips per route and
+# template render time, exposed at /metrics. When disabled nothing is hooked
+# in, so requests pay nothing for it.
+METRICS_ENABLED = os.getenv("METRICS") == "1"
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")  # lets a scraper in without an admin session
+registry = None
+
+def metrics_route():
+    if has_request_context():
+        return request.endpoint or "unmatched"
+    return "background"
+
+def record_mongo_command(command, seconds, failed):
+    route = metrics_route()
+    registry.observe("farmer_mongo_command_duration_seconds", (route, command), seconds)
+    if failed:
+        registry.inc("farmer_mongo_command_errors_total", (route, command))
+    if has_request_context():
+        request.__dict__["mongo_commands"] = request.__dict__.get("mongo_commands", 0) + 1
+
+def _start_request_timer():
+    request.__dict__["started_at"] = time.perf_counter()
+
+def _note_response_status(response):
+    request.__dict__["status"] = response.status_code
+    return response
+
+def _record_request(exc):
+    started = request.__dict__.get("started_at")
+    if started is None:
+        return
+    route = metrics_route()
+    registry.observe("farmer_http_request_duration_seconds", (route,), time.perf_counter() - started)
+    registry.inc("farmer_http_requests_total", (route, str(request.__dict__.get("status", 500))))
+    registry.observe("farmer_mongo_commands_per_request", (route,), request.__dict__.get("mongo_commands", 0))
+
+_render_started = threading.local()
+
+def _start_render_timer(sender, template, context, **extra):
+    _render_started.at = time.perf_counter()
+
+def _record_render(sender, template, context, **extra):
+    started = getattr(_render_started, "at", None)
+    if started is not None:
+        registry.observe("farmer_template_render_seconds", (template.name or "string",), time.perf_counter() - started)
+
+if METRICS_ENABLED:
+    import metrics
+    registry = metrics.Registry()
+    registry.histogram("farmer_http_request_duration_seconds", "Time spent handling a request.", ("route",))
+    registry.counter("farmer_http_requests_total", "Requests handled, by status code.", ("route", "status"))
+    registry.histogram("farmer_mongo_commands_per_request", "MongoDB round trips per request.", ("route",), metrics.COUNT_BUCKETS)
+    registry.histogram("farmer_mongo_command_duration_seconds", "MongoDB command latency.", ("route", "command"))
+    registry.counter("farmer_mongo_command_errors_total", "MongoDB commands that failed.", ("route", "command"))
+    registry.histogram("farmer_template_render_seconds", "Template render time.", ("template",))
+    app.before_request(_start_request_timer)
+    app.after_request(_note_response_status)
+    app.teardown_request(_record_request)
+    before_render_template.connect(_start_render_timer, app)
+    template_rendered.connect(_record_render, app)
+
+# MongoDB setup. The client is created on first use rather than at import
+# (keeps serverless cold starts cheap) and re-created in forked children.
+MONGO_URI = os.getenv("MONGO_URI", "mongodb://localhost:27017")
+MONGO_DB = os.getenv("MONGO_DB", "mydatabase")
+MONGO_OPTIONS = {
+    "appname": os.getenv("MONGO_APPNAME", "farmer-pro"),
+    "maxPoolSize": int(os.getenv("MONGO_MAX_POOL_SIZE", "10")),
+    "minPoolSize": int(os.getenv("MONGO_MIN_POOL_SIZE", "0")),
+    "maxIdleTimeMS": int(os.getenv("MONGO_MAX_IDLE_TIME_MS", "60000")),
+    "connectTimeoutMS": int(os.getenv("MONGO_CONNECT_TIMEOUT_MS", "5000")),
+    "serverSelectionTimeoutMS": int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", "5000")),
+    "socketTimeoutMS": int(os.getenv("MONGO_SOCKET_TIMEOUT_MS", "20000")),
+}
+_clients = {}  # uri -> MongoClient for this process
+_clients_pid = None
+_mongo_lock = threading.Lock()
+
+def get_client(uri):
+    global _clients_pid
+    client = _clients.get(uri) if _clients_pid == os.getpid() else None
+    if client is None:
+        with _mongo_lock:
+            if _clients_pid != os.getpid():
+                # Clients inherited across fork() must not be reused
+                _clients.clear()
+                _clients_pid = os.getpid()
+            client = _clients.get(uri)
+            if client is None:
+                listeners = [metrics.CommandTimer(record_mongo_command)] if METRICS_ENABLED else []
+                client = _clients[uri] = MongoClient(uri, connect=False, event_listeners=listeners, **MONGO_OPTIONS)
+    return client
+
+def get_mongo():
+    return get_client(MONGO_URI)
+
+# Tenant data -- projects and their task events, weight history and forecasts
+# -- is keyed by owner and can be spread over several databases or clusters:
+#
+#   MONGO_SHARDS="a=mongodb://db-a:27017/farmer b=mongodb://db-b:27017/farmer"
+#
+# Every owner lives on exactly one shard, chosen by rendezvous hashing of the
+# owner id over the shard names, so adding a shard only moves the owners that
+# now hash to it (see rebalance_tenants()). Shards are identified by name, not
+# URI, so hosts and credentials can change without moving anyone. Users,
+# sessions and the other global collections stay on MONGO_URI/MONGO_DB, which
+# is also the only shard when MONGO_SHARDS is unset.
+def parse_shards(spec):
+    shards = []
+    for entry in spec.split():
+        name, sep, uri = entry.partition("=")
+        if not sep or not name or not uri:
+            raise ValueError(f"MONGO_SHARDS entry {entry!r} is not name=mongodb://...")
+        shards.append((name, uri, urlsplit(uri).path.strip("/") or MONGO_DB))
+    return shards
+
+MONGO_SHARDS = parse_shards(os.getenv("MONGO_SHARDS", "")) or [("default", MONGO_URI, MONGO_DB)]
+
+# Every tenant document carries owner and every query on a tenant collection
+# filters on it, so each collection can also be sharded natively on owner.
+# MONGO_SHARD_KEY=hashed builds the {owner: "hashed"} index that
+# sh.shardCollection(ns, {owner: "hashed"}) needs; the compound indexes all
+# lead with owner, so a ranged {owner: 1} key needs nothing extra.
+MONGO_SHARD_KEY = os.getenv("MONGO_SHARD_KEY", "")
+
+# Read-only listing pages (a user's project list, the admin dashboard) may be
+# served by secondaries. Everything else reads from the primary.
+READ_PREFERENCES = {
+    "primary": Primary,
+    "primaryPreferred": PrimaryPreferred,
+    "secondary": Secondary,
+    "secondaryPreferred": SecondaryPreferred,
+    "nearest": Nearest,
+}
+LIST_READ_PREFERENCE = os.getenv("MONGO_LIST_READ_PREFERENCE", "secondaryPreferred")
+LIST_MAX_STALENESS = int(os.getenv("MONGO_LIST_MAX_STALENESS", "-1"))  # seconds; -1 for no limit, else >= 90
+if LIST_READ_PREFERENCE == "primary":
+    LIST_READS = Primary()
+else:
+    LIST_READS = READ_PREFERENCES[LIST_READ_PREFERENCE](max_staleness=LIST_MAX_STALENESS)
+
+@lru_cache(maxsize=65536)
+def owner_shard(owner):
+    """Index into MONGO_SHARDS of the shard holding ``owner``'s data."""
+    if len(MONGO_SHARDS) == 1:
+        return 0
+    return max(range(len(MONGO_SHARDS)),
+               key=lambda i: hashlib.sha1(f"{MONGO_SHARDS[i][0]}:{owner}".encode()).digest())
+
+class LazyCollection:
+    """Stand-in for a pymongo Collection that resolves the client on first use."""
+
+    def __init__(self, name, shard=None, read_preference=None):
+        self.name = name
+        self.shard = shard  # index into MONGO_SHARDS; None for the global database
+        self.read_preference = read_preference
+
+    def __getattr__(self, attr):
+        if self.shard is None:
+            coll = get_mongo()[MONGO_DB][self.name]
+        else:
+            _, uri, db = MONGO_SHARDS[self.shard]
+            coll = get_client(uri)[db][self.name]
+        if self.read_preference is not None:
+            coll = coll.with_options(read_preference=self.read_preference)
+        return getattr(coll, attr)
+
+    def stale_ok(self):
+        """The same collection, reading with LIST_READ_PREFERENCE."""
+        return LazyCollection(self.name, self.shard, LIST_READS)
+
+class OwnerCollection:
+    """A tenant collection, split over MONGO_SHARDS by owner.
+
+    It has no query methods of its own: callers either name the owner
+    (``for_owner``) or go over every shard (``shards``), so nothing can read
+    one shard by accident and miss the rest.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self._shards = [LazyCollection(name, i) for i in range(len(MONGO_SHARDS))]
+
+    def for_owner(self, owner):
+        return self._shards[owner_shard(owner)]
+
+    def on(self, shard):
+        return self._shards[shard]
+
+    def shards(self):
+        return list(self._shards)
+
+users_col = LazyCollection("users")
+proj_col = OwnerCollection("projects")
+forecasts_col = OwnerCollection("forecasts")  # cached growth forecast per project: {_id: project_id, owner, ...}, see refresh_forecasts()
+report_col = LazyCollection("feed_report")  # per-owner feed requirement rows, see refresh_feed_report()
+weights_col = OwnerCollection("weight_history")  # every reading: {owner, project_id, weight, at, source}
+events_col = OwnerCollection("task_events")  # one doc per (owner, project_id, date, task_idx): {done, photos}
+blobs_col = LazyCollection("photo_blobs")  # content-addressed photos: {_id: "<sha256>.<ext>", refs, size}
+meta_col = LazyCollection("app_meta")
+sessions_col = LazyCollection("sessions")  # server-side sessions: {_id: sid, data, expires}
+sync_col = LazyCollection("task_syncs")  # idempotency records of /projects/tasks/sync: {_id: "<user>:<key>", response}
+TENANT_COLLECTIONS = (proj_col, events_col, weights_col, forecasts_col)
+
+_scatter_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix="shard-scatter") if len(MONGO_SHARDS) > 1 else None
+
+def scatter(fn, collections):
+    """``[fn(c) for c in collections]``, run in parallel when there are several shards."""
+    if len(collections) == 1:
+        return [fn(collections[0])]
+    return list(_scatter_pool.map(fn, collections))
+
+def by_shard(owners):
+    """Group owner ids by the shard holding them: {shard: [owner, ...]}."""
+    groups = {}
+    for owner in owners:
+        groups.setdefault(owner_shard(owner), []).append(owner)
+    return groups
+
+def find_project(proj_id, owner, projection=None):
+    """One of ``owner``'s projects, or None."""
+    return proj_col.for_owner(owner).find_one({"_id": proj_id, "owner": owner}, projection)
+
+def locate_project(proj_id):
+    """A project by id alone (admin pages), looking at each shard in turn."""
+    for coll in proj_col.shards():
+        proj = coll.find_one({"_id": proj_id})
+        if proj:
+            return proj
+    return None
+
+def listing(coll):
+    """``coll`` for a read-only listing page.
+
+    Secondaries may serve these, except right after a write: a pending flash
+    means the user was just redirected here from one, so that page reads from
+    the primary and shows the change.
+    """
+    return coll if "_flashes" in session else coll.stale_ok()
+
+def bson_sort_value(value):
+    """Sort key ordering mixed values the way MongoDB does (null < numbers < strings < ...)."""
+    if value is None:
+        return (0, 0)
+    if isinstance(value, bool):
+        return (4, value)
+    if isinstance(value, (int, float)):
+        return (1, value)
+    if isinstance(value, str):
+        return (2, value)
+    if isinstance(value, ObjectId):
+        return (3, value)
+    if isinstance(value, datetime.datetime):
+        return (5, value)
+    return (6, str(value))
+
+def find_sorted(collections, query, sort_spec, limit):
+    """First ``limit`` documents by ``sort_spec`` across shards (top-n per shard, merged)."""
+    parts = scatter(lambda coll: list(coll.find(query).sort(sort_spec).limit(limit)), collections)
+    if len(parts) == 1:
+        return parts[0]
+    rows = [doc for part in parts for doc in part]
+    # Stable sorts, least significant key first
+    for field, direction in reversed(sort_spec):
+        rows.sort(key=lambda doc: bson_sort_value(doc.get(field)), reverse=direction == DESCENDING)
+    return rows[:limit]
+
+# Sessions. SESSION_BACKEND=cookie keeps Flask's signed-cookie session; "disk"
+# and "mongo" keep the data server-side and put only a signed id in the cookie.
+SESSION_BACKEND = os.getenv("SESSION_BACKEND", "cookie")
+SESSION_DIR = os.getenv("SESSION_DIR", os.path.join(os.getcwd(), "flask_session"))
+SESSION_DISK_MAX_FILES = int(os.getenv("SESSION_DISK_MAX_FILES", "10000"))
+SESSION_COMPACT_INTERVAL = 300  # seconds between disk sweeps, per process
+
+class ServerSideSession(CallbackDict, SessionMixin):
+    def __init__(self, initial=None, sid=None, expires=None, new=False):
+        def on_update(self):
+            self.modified = True
+            self.accessed = True
+        super().__init__(initial, on_update)
+        self.sid = sid
+        self.expires = expires
+        self.new = new
+        self.modified = False
+        self.accessed = False
+        self.replaced_sid = None
+
+    # Reads are tracked like Flask's cookie session so responses that never
+    # looked at the session don't get Vary: Cookie
+    def __getitem__(self, key):
+        self.accessed = True
+        return super().__getitem__(key)
+
+    def get(self, key, default=None):
+        self.accessed = True
+        return super().get(key, default)
+
+    def setdefault(self, key, default=None):
+        self.accessed = True
+        return super().setdefault(key, default)
+
+    def regenerate(self):
+        """Move the data to a fresh id; the old record is deleted on save."""
+        if not self.new and self.replaced_sid is None:
+            self.replaced_sid = self.sid
+        self.sid = secrets.token_urlsafe(32)
+        self.expires = None
+        self.modified = True
+
+def rotate_session():
+    """New server-side session id when the user changes (login, signup, logout).
+
+    A session id handed out before login would otherwise stay valid for the
+    logged-in user (session fixation). Cookie sessions carry their data in
+    the cookie itself and need nothing.
+    """
+    if isinstance(session, ServerSideSession):
+        session.regenerate()
+
+class ServerSessionInterface(SessionInterface):
+    """Base for server-side stores; subclasses implement load/store/delete."""
+
+    serializer = TaggedJSONSerializer()
+
+    def _signer(self, app):
+        return Signer(app.secret_key, salt="server-session")
+
+    def open_session(self, app, request):
+        cookie = request.cookies.get(self.get_cookie_name(app))
+        if cookie:
+            try:
+                sid = self._signer(app).unsign(cookie).decode()
+            except BadSignature:
+                sid = None
+            if sid:
+                loaded = self.load(sid)
+                if loaded is not None:
+                    data, expires = loaded
+                    return ServerSideSession(self.serializer.loads(data), sid=sid, expires=expires)
+        return ServerSideSession(sid=secrets.token_urlsafe(32), new=True)
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+        if session.replaced_sid:
+            self.delete(session.replaced_sid)
+        if not session:
+            if not session.new:
+                self.delete(session.sid)
+            if session.modified:
+                response.delete_cookie(name, domain=domain, path=path)
+            return
+        if session.accessed:
+            response.vary.add("Cookie")
+        now = datetime.datetime.utcnow()
+        lifetime = app.permanent_session_lifetime
+        # Sliding expiry without a write on every request: only touch the store
+        # when data changed or half the lifetime has passed. The cookie is only
+        # re-sent along with a write, so long-cached responses (photos, assets)
+        # stay free of Set-Cookie.
+        if not (session.modified or session.expires is None or session.expires - now < lifetime / 2):
+            return
+        self.store(session.sid, self.serializer.dumps(dict(session)), now + lifetime)
+        response.set_cookie(
+            name,
+            self._signer(app).sign(session.sid).decode(),
+            expires=self.get_expiration_time(app, session),
+            httponly=self.get_cookie_httponly(app),
+            domain=domain,
+            path=path,
+            secure=self.get_cookie_secure(app),
+            samesite=self.get_cookie_samesite(app),
+        )
+
+class DiskSessionInterface(ServerSessionInterface):
+    """One file per session; expired files are swept in bounded passes."""
+
+    def __init__(self, directory, max_files):
+        self.directory = directory
+        self.max_files = max_files
+        self._last_compact = 0.0
+        self._ready = False
+
+    def _path(self, sid):
+        return os.path.join(self.directory, hashlib.sha256(sid.encode()).hexdigest())
+
+    def load(self, sid):
+        try:
+            with open(self._path(sid)) as f:
+                record = json.load(f)
+            expires = datetime.datetime.fromisoformat(record["expires"])
+            data = record["data"]
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+        if expires <= datetime.datetime.utcnow():
+            self.delete(sid)
+            return None
+        return data, expires
+
+    def store(self, sid, data, expires):
+        if not self._ready:
+            os.makedirs(self.directory, exist_ok=True)
+            self._ready = True
+        path = self._path(sid)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"data": data, "expires": expires.isoformat()}, f)
+        os.replace(tmp_path, path)
+        # File mtime doubles as the expiry so compaction never has to read files
+        ts = expires.replace(tzinfo=datetime.timezone.utc).timestamp()
+        os.utime(path, (ts, ts))
+        if time.monotonic() - self._last_compact > SESSION_COMPACT_INTERVAL:
+            self._last_compact = time.monotonic()
+            self.compact()
+
+    def delete(self, sid):
+        try:
+            os.remove(self._path(sid))
+        except FileNotFoundError:
+            pass
+
+    def compact(self):
+        """Remove expired sessions, then the oldest ones beyond max_files."""
+        now = time.time()
+        live = []
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                try:
+                    expires = entry.stat().st_mtime
+                    if expires <= now:
+                        os.remove(entry.path)
+                    else:
+                        live.append((expires, entry.path))
+                except FileNotFoundError:
+                    pass
+        if len(live) > self.max_files:
+            live.sort()
+            for _, path in live[:len(live) - self.max_files]:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+
+class MongoSessionInterface(ServerSessionInterface):
+    """Sessions shared by every worker/instance; a TTL index drops expired ones.
+
+    The index is ensured by the store itself (once per process) rather than
+    by migrate(), so switching an existing deployment to
+    SESSION_BACKEND=mongo can't leave the collection growing without bound.
+    """
+
+    _ttl_ready = False
+
+    def load(self, sid):
+        record = sessions_col.find_one({"_id": sid, "expires": {"$gt": datetime.datetime.utcnow()}})
+        return (record["data"], record["expires"]) if record else None
+
+    def store(self, sid, data, expires):
+        if not self._ttl_ready:
+            sessions_col.create_index([("expires", ASCENDING)], expireAfterSeconds=0)
+            MongoSessionInterface._ttl_ready = True
+        sessions_col.update_one({"_id": sid}, {"$set": {"data": data, "expires": expires}}, upsert=True)
+
+    def delete(self, sid):
+        sessions_col.delete_one({"_id": sid})
+
+if SESSION_BACKEND == "disk":
+    app.session_interface = DiskSessionInterface(SESSION_DIR, SESSION_DISK_MAX_FILES)
+elif SESSION_BACKEND == "mongo":
+    app.session_interface = MongoSessionInterface()
 
 # File upload setup
 UPLOAD_FOLDER = os.path.join(os.getcwd(), "static", "uploads")
-os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+UPLOAD_TMP_FOLDER = os.path.join(UPLOAD_FOLDER, ".tmp")
+THUMB_FOLDER = os.path.join(UPLOAD_FOLDER, "thumbs")
+THUMB_SIZE = (320, 320)
+_upload_dirs_ready = False
+
+def ensure_upload_dirs():
+    global _upload_dirs_ready
+    if not _upload_dirs_ready:
+        for folder in (UPLOAD_FOLDER, UPLOAD_TMP_FOLDER, THUMB_FOLDER):
+            os.makedirs(folder, exist_ok=True)
+        _upload_dirs_ready = True
 app.config["UPLOAD_FOLDER"] = UPLOAD_FOLDER
 app.config["MAX_CONTENT_LENGTH"] = 50 * 1024 * 1024  # 2 MB
 ALLOWED_EXT = {"png", "jpg", "jpeg", "gif"}
 
+# Password hashing: bcrypt runs on a small dedicated pool. Requests beyond
+# workers + queue depth are rejected with 429 instead of piling up.
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+BCRYPT_WORKERS = int(os.getenv("BCRYPT_WORKERS", "2"))
+BCRYPT_QUEUE_DEPTH = int(os.getenv("BCRYPT_QUEUE_DEPTH", "8"))
+_hash_pool = ThreadPoolExecutor(max_workers=BCRYPT_WORKERS, thread_name_prefix="bcrypt")
+_hash_slots = threading.BoundedSemaphore(BCRYPT_WORKERS + BCRYPT_QUEUE_DEPTH)
+
+def run_hashing(fn, *args):
+    if not _hash_slots.acquire(blocking=False):
+        logging.warning("bcrypt pool saturated, rejecting request")
+        raise TooManyRequests("Server is busy, please try again shortly.", retry_after=2)
+    try:
+        return _hash_pool.submit(fn, *args).result()
+    finally:
+        _hash_slots.release()
+
+def hash_password(password):
+    return run_hashing(lambda: bcrypt.hashpw(password.encode(), bcrypt.gensalt(BCRYPT_ROUNDS)))
+
+def check_password(password, pw_hash):
+    return run_hashing(bcrypt.checkpw, password.encode(), pw_hash)
+
+def password_needs_rehash(pw_hash):
+    # bcrypt hashes look like $2b$<cost>$<salt+digest>
+    try:
+        return int(pw_hash.split(b"$")[2]) != BCRYPT_ROUNDS
+    except (IndexError, ValueError):
+        return False
+
+# Migrations. Index builds and data backfills never run on the request path:
+# run `flask --app index migrate` (or POST /admin/migrate as an admin) on a new
+# database, after a deploy that bumps INDEX_VERSION, and after changing
+# MONGO_SHARDS or MONGO_SHARD_KEY. It is a single marker lookup once this
+# INDEX_VERSION has been applied; bump it when the index set or backfills change.
+INDEX_VERSION = 6
+
+def migrate_legacy_tasks(shard):
+    """Move the task_done/task_photo dicts embedded in old projects into task_events.
+
+    They hold the state of the day in task_done_reset_date, keyed by task
+    index (date keys left behind by the old daily reset are skipped). The
+    fields are only dropped once the events are written.
+    """
+    projects, events = proj_col.on(shard), events_col.on(shard)
+    legacy = {"$or": [{"task_done": {"$exists": True}}, {"task_photo": {"$exists": True}}]}
+    fields = {"owner": 1, "today": 1, "task_done": 1, "task_photo": 1, "task_done_reset_date": 1}
+    for proj in projects.find(legacy, fields):
+        day = proj.get("task_done_reset_date") or proj.get("today") or date.today().isoformat()
+        task_done, task_photo = proj.get("task_done") or {}, proj.get("task_photo") or {}
+        ops = []
+        for idx in set(task_done) | set(task_photo):
+            done, photos = task_done.get(idx), task_photo.get(idx)
+            if isinstance(photos, str):
+                photos = [photos]
+            photos = [p for p in photos if isinstance(p, str)] if isinstance(photos, list) else []
+            if not isinstance(done, bool) and not photos:
+                continue
+            update = {}
+            if done is True or photos:
+                update["$set"] = {"done": True}
+            else:
+                update["$setOnInsert"] = {"done": False}
+            if photos:
+                update["$addToSet"] = {"photos": {"$each": photos}}
+            ops.append(UpdateOne(task_event_key(proj.get("owner"), proj["_id"], day, idx), update, upsert=True))
+        if ops:
+            events.bulk_write(ops, ordered=False)
+        projects.update_one({"_id": proj["_id"]}, {"$unset": {"task_done": "", "task_photo": "", "task_done_reset_date": ""}})
+
+def backfill_owner(shard, chunk=1000):
+    """Copy each project's owner onto its task events, weight readings and forecasts.
+
+    Only projects that still have documents without an owner are looked up,
+    so a re-run after a partial backfill (or on an up to date shard) is cheap.
+    """
+    projects = proj_col.on(shard)
+    for coll, field in ((events_col, "project_id"), (weights_col, "project_id"), (forecasts_col, "_id")):
+        target = coll.on(shard)
+        pending = target.aggregate([{"$match": {"owner": {"$exists": False}}}, {"$group": {"_id": f"${field}"}}],
+                                   allowDiskUse=True)
+        ids = [doc["_id"] for doc in pending]
+        for i in range(0, len(ids), chunk):
+            ops = [UpdateMany({field: p["_id"], "owner": {"$exists": False}}, {"$set": {"owner": p.get("owner")}})
+                   for p in projects.find({"_id": {"$in": ids[i:i + chunk]}}, {"owner": 1})]
+            if ops:
+                target.bulk_write(ops, ordered=False)
+
+def drop_index_if_present(coll, name):
+    try:
+        coll.drop_index(name)
+    except OperationFailure:
+        pass
+
+def ensure_shard_indexes(shard):
+    projects, events, weights = proj_col.on(shard), events_col.on(shard), weights_col.on(shard)
+    # Lower-cased copies of searchable names so prefix search can use an index
+    projects.update_many({"name_lc": {"$exists": False}}, [{"$set": {"name_lc": {"$toLower": "$name"}}}])
+    migrate_legacy_tasks(shard)
+    backfill_owner(shard)
+    projects.create_index([("owner", ASCENDING), ("_id", ASCENDING)])
+    projects.create_index([("name_lc", ASCENDING), ("_id", ASCENDING)])
+    projects.create_index([("type", ASCENDING), ("_id", ASCENDING)])
+    projects.create_index([("updated_at", ASCENDING)])
+    # Unique keys must start with the shard key to survive native sharding
+    events.create_index([("owner", ASCENDING), ("project_id", ASCENDING), ("date", ASCENDING), ("task_idx", ASCENDING)], unique=True)
+    drop_index_if_present(events, "project_id_1_date_1_task_idx_1")
+    weights.create_index([("owner", ASCENDING), ("project_id", ASCENDING), ("at", ASCENDING)])
+    drop_index_if_present(weights, "project_id_1_at_1")
+    if MONGO_SHARD_KEY == "hashed":
+        for coll in TENANT_COLLECTIONS:
+            coll.on(shard).create_index([("owner", HASHED)])
+
+def migrate(force=False):
+    """Build the indexes and run the backfills unless this version already has."""
+    # Re-run when the shard list or shard key changes so every shard gets its indexes
+    marker = {"_id": "indexes", "version": INDEX_VERSION, "shards": [name for name, _, _ in MONGO_SHARDS],
+              "shard_key": MONGO_SHARD_KEY}
+    if not force and meta_col.find_one(marker, {"_id": 1}):
+        return {"applied": False, "version": INDEX_VERSION}
+    started = time.perf_counter()
+    for shard in range(len(MONGO_SHARDS)):
+        ensure_shard_indexes(shard)
+    users_col.update_many({"name_lc": {"$exists": False}}, [{"$set": {"name_lc": {"$toLower": "$name"}}}])
+    users_col.create_index([("email", ASCENDING)])
+    users_col.create_index([("name_lc", ASCENDING)])
+    sync_col.create_index([("created", ASCENDING)], expireAfterSeconds=SYNC_KEY_TTL)
+    meta_col.update_one({"_id": "indexes"}, {"$set": marker}, upsert=True)
+    seconds = round(time.perf_counter() - started, 3)
+    logging.info(f"Applied migrations for index version {INDEX_VERSION} in {seconds}s")
+    return {"applied": True, "version": INDEX_VERSION, "seconds": seconds}
+
+@app.cli.command("migrate")
+@click.option("--force", is_flag=True, help="Run even if this version is already applied.")
+def migrate_command(force):
+    """Build indexes and backfill data for this INDEX_VERSION."""
+    result = migrate(force=force)
+    click.echo(f"index version {result['version']}: " + ("applied" if result["applied"] else "already applied"))
+
+@app.before_request
+def _start_background_jobs():
+    ensure_upload_gc()
+
 def allowed(filename):
     return "." in filename and filename.rsplit(".", 1)[1].lower() in ALLOWED_EXT
 
+# Thumbnails are generated off the request path by a single background worker
+_thumb_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="thumbs")
+
+def thumb_name(filename):
+    return os.path.splitext(filename)[0] + ".webp"
+
+def make_thumbnail(filename):
+    try:
+        with Image.open(os.path.join(UPLOAD_FOLDER, filename)) as img:
+            img = ImageOps.exif_transpose(img)
+            img.thumbnail(THUMB_SIZE)
+            if img.mode not in ("RGB", "RGBA"):
+                img = img.convert("RGBA" if "transparency" in img.info else "RGB")
+            tmp_path = os.path.join(UPLOAD_TMP_FOLDER, "thumb_" + thumb_name(filename))
+            img.save(tmp_path, "WEBP", quality=80)
+        os.replace(tmp_path, os.path.join(THUMB_FOLDER, thumb_name(filename)))
+    except Exception as e:
+        logging.error(f"Thumbnail generation failed for {filename}: {e}")
+
+HASHED_NAME_RE = re.compile(r"^[0-9a-f]{64}\.[a-z0-9]+$")
+PHOTO_MAX_AGE = 365 * 24 * 3600
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def save_upload(file, ref=True):
+    """Store an uploaded photo under its content hash and return the filename.
+
+    Identical photos share one file; photo_blobs counts the references so the
+    file is only removed when the last one goes away. With ref=False the
+    photo is stored unreferenced (last_ref keeps it past upload GC's grace
+    period) and whatever links it to a task takes the reference.
+    """
+    ensure_upload_dirs()
+    stream = file.stream
+    if getattr(stream, "name", None) in request.__dict__.get("upload_tmp_files", ()):
+        stream.close()
+        tmp_path = stream.name
+    else:
+        tmp_path = os.path.join(UPLOAD_TMP_FOLDER, f"upload_{ObjectId()}")
+        file.save(tmp_path)
+        request.__dict__.setdefault("upload_tmp_files", []).append(tmp_path)
+    ext = file.filename.rsplit(".", 1)[1].lower()
+    filename = f"{file_sha256(tmp_path)}.{ext}"
+    path = os.path.join(UPLOAD_FOLDER, filename)
+
+    blobs_col.update_one(
+        {"_id": filename},
+        {"$inc": {"refs": 1 if ref else 0}, "$set": {"last_ref": datetime.datetime.utcnow()},
+         "$setOnInsert": {"size": os.path.getsize(tmp_path), "created": datetime.datetime.utcnow()}},
+        upsert=True,
+    )
+    if os.path.exists(path):
+        return filename  # duplicate content; the temp copy is dropped at teardown
+    os.replace(tmp_path, path)
+    if Image is not None:
+        _thumb_pool.submit(make_thumbnail, filename)
+    return filename
+
+def remove_upload(filename):
+    if HASHED_NAME_RE.match(filename):
+        blob = blobs_col.find_one_and_update({"_id": filename}, {"$inc": {"refs": -1}}, return_document=ReturnDocument.AFTER)
+        if blob and blob["refs"] > 0:
+            return
+        if blob and not blobs_col.delete_one({"_id": filename, "refs": {"$lte": 0}}).deleted_count:
+            return  # re-referenced in the meantime
+    for path in (os.path.join(UPLOAD_FOLDER, filename), os.path.join(THUMB_FOLDER, thumb_name(filename))):
+        if os.path.exists(path):
+            try:
+                os.remove(path)
+            except Exception as e:
+                logging.error(f"Error deleting image {filename}: {e}")
+
+@app.teardown_request
+def _cleanup_upload_tmp(exc):
+    # Temp files of parts that were rejected (or never saved) are dropped here
+    for path in request.__dict__.get("upload_tmp_files", ()):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logging.error(f"Error removing temp upload {path}: {e}")
+
+@app.template_global()
+def photo_url(filename, original=False):
+    thumb = thumb_name(filename)
+    if not original and os.path.exists(os.path.join(THUMB_FOLDER, thumb)):
+        if HASHED_NAME_RE.match(filename):
+            return url_for("photo_file", name="thumbs/" + thumb)
+        return url_for("static", filename="uploads/thumbs/" + thumb)
+    if HASHED_NAME_RE.match(filename):
+        if not original and Image is not None and has_request_context():
+            request.__dict__["thumb_pending"] = True  # thumbnail not written yet; see cached_fragment
+        return url_for("photo_file", name=filename)
+    return url_for("static", filename="uploads/" + filename)
+
+# Rendered template fragments. Keys carry a version hash of everything the
+# fragment shows (plus the date), so entries never go stale; the cache is
+# simply cleared when it fills up.
+FRAGMENT_CACHE_SIZE = int(os.getenv("FRAGMENT_CACHE_SIZE", "2048"))
+_fragment_cache = {}
+_fragment_lock = threading.Lock()
+
+def content_version(*parts):
+    return hashlib.sha1(json.dumps(parts, sort_keys=True, default=str).encode()).hexdigest()[:16]
+
+@lru_cache(maxsize=None)
+def template_rev(*names):
+    """Hash of the given templates' source, so a deploy changes every ETag."""
+    digest = hashlib.sha1()
+    for name in names:
+        digest.update(app.jinja_loader.get_source(app.jinja_env, name)[0].encode())
+    return digest.hexdigest()[:8]
+
+@app.template_global()
+def cached_fragment(template, key, **context):
+    html = _fragment_cache.get((template, key))
+    if html is None:
+        request.__dict__.pop("thumb_pending", None)
+        html = Markup(app.jinja_env.get_template(template).render(**context))
+        # Markup pointing at originals would outlive the thumbnails; render again next time
+        if not request.__dict__.pop("thumb_pending", None):
+            with _fragment_lock:
+                if len(_fragment_cache) >= FRAGMENT_CACHE_SIZE:
+                    _fragment_cache.clear()
+                _fragment_cache[(template, key)] = html
+    return html
+
+@app.route("/photos/<path:name>")
+def photo_file(name):
+    # Hashed names never change content, so they can be cached forever
+    if not HASHED_NAME_RE.match(name.removeprefix("thumbs/")):
+        abort(404)
+    response = send_from_directory(UPLOAD_FOLDER, name, max_age=PHOTO_MAX_AGE)
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
+# Built static assets (python assets.py). Templates use asset_url/asset_tags,
+# which point at fingerprinted files once built and at static/ otherwise.
+ASSET_MAX_AGE = 365 * 24 * 3600
+_asset_manifest = None
+
+def asset_manifest():
+    global _asset_manifest
+    if _asset_manifest is None:
+        _asset_manifest = assets.load_manifest()
+        if not _asset_manifest and os.getenv("VERCEL"):
+            logging.warning("static/dist/manifest.json is missing: serving unfingerprinted, uncompressed assets. "
+                            "Run `python assets.py` before deploying (see assets.py).")
+    return _asset_manifest
+
+@app.template_global()
+def asset_url(name):
+    built = asset_manifest().get(name)
+    if built:
+        return url_for("asset_file", name=built)
+    return url_for("static", filename=name)
+
+@app.template_global()
+def asset_tags(bundle):
+    names = [bundle] if bundle in asset_manifest() else assets.BUNDLES[bundle]
+    tag = '<link rel="stylesheet" href="{}">' if bundle.endswith(".css") else '<script src="{}"></script>'
+    return Markup("\n".join(tag.format(escape(asset_url(name))) for name in names))
+
+@app.route("/assets/<path:name>")
+def asset_file(name):
+    # Fingerprinted names never change content; send the precompressed copy when accepted
+    for encoding, suffix in (("br", ".br"), ("gzip", ".gz")):
+        if request.accept_encodings[encoding] and os.path.isfile(os.path.join(assets.DIST_DIR, name + suffix)):
+            response = send_from_directory(assets.DIST_DIR, name + suffix, max_age=ASSET_MAX_AGE,
+                                           mimetype=mimetypes.guess_type(name)[0])
+            response.content_encoding = encoding
+            break
+    else:
+        response = send_from_directory(assets.DIST_DIR, name, max_age=ASSET_MAX_AGE)
+    response.vary.add("Accept-Encoding")
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
 # Helper functions
 def days_since(d):
     if isinstance(d, str):
@@ -59,9 +945,13 @@ def days_since(d):
         d = d.date()
     return (datetime.date.today() - d).days
 
+def next_day_start(now=None):
+    now = now or datetime.datetime.now()
+    return (now + datetime.timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
+
 def time_left_for_next_day_bangla():
     now = datetime.datetime.now()
-    next_day = (now + datetime.timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
+    next_day = next_day_start(now)
     remaining = next_day - now
     total_seconds = int(remaining.total_seconds())
     hours, remainder = divmod(total_seconds, 3600)
@@ -69,111 +959,188 @@ def time_left_for_next_day_bangla():
 
     return f"{hours:02} ঘণ্টা {minutes:02} মিনিট {seconds:02} সেকেন্ড"
 
+# Per-animal tables below are keyed by project type; types without an entry
+# (e.g. sheep) use the cow values. register_animal() adds a type to all of them.
+DEFAULT_ANIMAL = "cow"
+
+def animal_value(table, animal):
+    return table.get(animal, table[DEFAULT_ANIMAL])
+
+def animal_expr(table, animal, to_expr):
+    # animal_value() as a MongoDB aggregation expression on the ``animal`` field
+    branches = [{"case": {"$eq": [animal, name]}, "then": to_expr(value)}
+                for name, value in table.items() if name != DEFAULT_ANIMAL]
+    default = to_expr(table[DEFAULT_ANIMAL])
+    return {"$switch": {"branches": branches, "default": default}} if branches else default
+
+# Feed level brackets: level N while weight is below the N-th threshold
+FEED_LEVEL_THRESHOLDS = {
+    "goat": [15, 18, 21, 23],
+    "cow": [150, 280],
+}
+
 def feed_level(weight, animal):
-    if animal == "goat":
-        if weight < 15: return 1
-        elif weight < 18: return 2
-        elif weight < 21: return 3
-        elif weight < 23: return 4
-        return 5
-    else:  # cow
-        if weight < 150: return 1
-        elif weight < 280: return 2
-        return 3
+    thresholds = animal_value(FEED_LEVEL_THRESHOLDS, animal)
+    for level, limit in enumerate(thresholds, start=1):
+        if weight < limit:
+            return level
+    return len(thresholds) + 1
+
+def bracket_expr(weight, branches, default):
+    # [(limit, value), ...] -> first value whose limit the weight is below
+    if not branches:
+        return default
+    return {"$switch": {
+        "branches": [{"case": {"$lt": [weight, limit]}, "then": value} for limit, value in branches],
+        "default": default,
+    }}
+
+def feed_level_expr(weight, animal):
+    # Same brackets as feed_level(), as a MongoDB aggregation expression
+    def brackets(thresholds):
+        return bracket_expr(weight, [(limit, level) for level, limit in enumerate(thresholds, start=1)],
+                            len(thresholds) + 1)
+    return animal_expr(FEED_LEVEL_THRESHOLDS, animal, brackets)
+
+# Green grass per feeding (kg): (weight limit, amount) brackets and the amount above them
+GRASS_BRACKETS = {
+    "goat": ([], 2.5),
+    "cow": ([(150, 5), (250, 7.5), (400, 12.5)], 17.5),
+}
 
 def Grass(weight, animal):
-    if animal == "goat":
-        return 2.5
-    else:
-        if weight < 150:
-            return 5
-        elif weight < 250:
-            return 7.5
-        if weight < 400:
-            return 12.5
-        elif weight < 500:
-            return 17.5
-        return 17.5
-
-def build_schedule(day, weight, animal):
-    day=day # need work
-    if animal == "cow":
-        return [
-            {
-                "phase": "সকাল",
-                "tasks": [
-                    {"description": "গোয়াল ঘর পরিষ্কার করুন, চারি পরিষ্কার করুন, গরুর পা হাঁটু পর্যন্ত ধুয়ে দিন", "time_range": "সকাল ৬ঃ০০ - ৭ঃ০০"},
-                    {"description": f"সবুজ ঘাস খাওয়ান ({Grass(weight, animal)} কেজি)", "time_range": "সকাল ৭ঃ০০ - ৮ঃ০০"},
-                    {"description": f"দানাদার খাদ্য {feed_level(weight, animal)} কেজি + চিটাগুড় মিশ্রিত পানি খাওয়ান (৫ গ্রাম / ৫ লিটার)", "time_range": "সকাল ৮ঃ০০ - ৯ঃ০০"},
-                    {"description": "খড় খাওয়ান (চিটাগুড় মিশ্রিত পানি খড়ের উপর ছিটিয়ে দিন)", "time_range": "সকাল ৯ঃ০০ - ১০ঃ০০"},
-                    {"description": "প্রয়োজন অনুযায়ী সবুজ ঘাস প্রদান করুন", "time_range": "সকাল ১০ঃ০০ - ১১ঃ০০"},
-                ]
-            },
-            {
-                "phase": "দুপুর",
-                "tasks": [
-                    {"description": "পানি দিয়ে চারি ধুয়ে দিন, গোয়াল ঘর পরিষ্কার করুন", "time_range": "সকাল ১১ঃ০০ - ১২ঃ০০"},
-                    {"description": "গরুকে গোসল করিয়ে দিন (গরমে প্রতিদিন, শীতে ২ দিনে একবার)", "time_range": "দুপুর ১২ঃ০০ - ১ঃ০০"},
-                    {"description": "চারিতে পরিষ্কার পানি দিন এবং গরুকে বিশ্রাম নিতে দিন", "time_range": "দুপুর ১ঃ০০ - ৩ঃ০০"},
-                ]
-            },
-            {
-                "phase": "বিকাল",
-                "tasks": [
-                    {"description": f"সবুজ ঘাস খাওয়ান ({Grass(weight, animal)} কেজি)", "time_range": "বিকাল ৩ঃ০০ - ৪ঃ০০"},
-                    {"description": f"দানাদার খাদ্য খাওয়ান {feed_level(weight, animal)} কেজি", "time_range": "বিকাল ৪ঃ০০ - ৫ঃ০০"},
-                    {"description": "খড় খাওয়ান (চিটাগুড় মিশ্রিত পানি খড়ের উপর ছিটিয়ে দিন)", "time_range": "বিকাল ৫ঃ০০ - ৬ঃ০০"},
-                    {"description": "প্রয়োজন অনুযায়ী সবুজ ঘাস প্রদান করুন", "time_range": "বিকাল ৬ঃ০০ - সন্ধ্যা ৬ঃ৪৫"},
-                ]
-            },
-            {
-                "phase": "সন্ধ্যা",
-                "tasks": [
-                    {"description": "গোয়াল ঘর পরিষ্কার করুন, রাতের জন্য কয়েল জ্বালিয়ে দিন, চারি পরিষ্কার করে পানি দিন", "time_range": "সন্ধ্যা ৭ঃ০০ - ৮ঃ০০"}
-                ]
-            }
+    brackets, default = animal_value(GRASS_BRACKETS, animal)
+    for limit, amount in brackets:
+        if weight < limit:
+            return amount
+    return default
+
+def grass_expr(weight, animal):
+    # Same brackets as Grass(), as a MongoDB aggregation expression
+    return animal_expr(GRASS_BRACKETS, animal, lambda brackets: bracket_expr(weight, *brackets))
+
+# Schedule templates per animal. "{grass}", "{feed}" and "{animal}" in a
+# description are filled in from Grass(), feed_level() and the animal name.
+SCHEDULE_TEMPLATES = {
+    "cow": [
+        {
+            "phase": "সকাল",
+            "tasks": [
+                {"description": "গোয়াল ঘর পরিষ্কার করুন, চারি পরিষ্কার করুন, গরুর পা হাঁটু পর্যন্ত ধুয়ে দিন", "time_range": "সকাল ৬ঃ০০ - ৭ঃ০০"},
+                {"description": "সবুজ ঘাস খাওয়ান ({grass} কেজি)", "time_range": "সকাল ৭ঃ০০ - ৮ঃ০০"},
+                {"description": "দানাদার খাদ্য {feed} কেজি + চিটাগুড় মিশ্রিত পানি খাওয়ান (৫ গ্রাম / ৫ লিটার)", "time_range": "সকাল ৮ঃ০০ - ৯ঃ০০"},
+                {"description": "খড় খাওয়ান (চিটাগুড় মিশ্রিত পানি খড়ের উপর ছিটিয়ে দিন)", "time_range": "সকাল ৯ঃ০০ - ১০ঃ০০"},
+                {"description": "প্রয়োজন অনুযায়ী সবুজ ঘাস প্রদান করুন", "time_range": "সকাল ১০ঃ০০ - ১১ঃ০০"},
+            ]
+        },
+        {
+            "phase": "দুপুর",
+            "tasks": [
+                {"description": "পানি দিয়ে চারি ধুয়ে দিন, গোয়াল ঘর পরিষ্কার করুন", "time_range": "সকাল ১১ঃ০০ - ১২ঃ০০"},
+                {"description": "গরুকে গোসল করিয়ে দিন (গরমে প্রতিদিন, শীতে ২ দিনে একবার)", "time_range": "দুপুর ১২ঃ০০ - ১ঃ০০"},
+                {"description": "চারিতে পরিষ্কার পানি দিন এবং গরুকে বিশ্রাম নিতে দিন", "time_range": "দুপুর ১ঃ০০ - ৩ঃ০০"},
+            ]
+        },
+        {
+            "phase": "বিকাল",
+            "tasks": [
+                {"description": "সবুজ ঘাস খাওয়ান ({grass} কেজি)", "time_range": "বিকাল ৩ঃ০০ - ৪ঃ০০"},
+                {"description": "দানাদার খাদ্য খাওয়ান {feed} কেজি", "time_range": "বিকাল ৪ঃ০০ - ৫ঃ০০"},
+                {"description": "খড় খাওয়ান (চিটাগুড় মিশ্রিত পানি খড়ের উপর ছিটিয়ে দিন)", "time_range": "বিকাল ৫ঃ০০ - ৬ঃ০০"},
+                {"description": "প্রয়োজন অনুযায়ী সবুজ ঘাস প্রদান করুন", "time_range": "বিকাল ৬ঃ০০ - সন্ধ্যা ৬ঃ৪৫"},
+            ]
+        },
+        {
+            "phase": "সন্ধ্যা",
+            "tasks": [
+                {"description": "গোয়াল ঘর পরিষ্কার করুন, রাতের জন্য কয়েল জ্বালিয়ে দিন, চারি পরিষ্কার করে পানি দিন", "time_range": "সন্ধ্যা ৭ঃ০০ - ৮ঃ০০"}
+            ]
+        }
+    ],
+    "goat": [
+        {
+            "phase": "সকাল",
+            "tasks": [
+                {"description": "ছাগলের ঘর পরিষ্কার করুন, চারি পরিষ্কার করুন, ছাগলের পা হাঁটু পর্যন্ত ধুয়ে দিন", "time_range": "সকাল ৬ঃ০০ - ৭ঃ০০"},
+                {"description": "সবুজ ঘাস খাওয়ান {grass} কেজি", "time_range": "সকাল ৭ঃ০০ - ৮ঃ০০"},
+                {"description": "দানাদার খাদ্য {feed} গ্রাম(একটি বাটিতে পরিমাপ করে দিন) + চিটাগুড় মিশ্রিত পানি (৫ গ্রাম / ৫ লিটার)", "time_range": "সকাল ৮ঃ০০ - ৯ঃ০০"},
+                {"description": "খড় খাওয়ান (চিটাগুড় মিশ্রিত পানি খড়ের উপর ছিটিয়ে দিন)", "time_range": "সকাল ৯ঃ০০ - ১০ঃ০০"},
+                {"description": "প্রয়োজন অনুযায়ী সবুজ ঘাস প্রদান করুন", "time_range": "সকাল ১০ঃ০০ - ১১ঃ০০"},
+                {"description": "পানি দিয়ে চারি ধুয়ে দিন, ছাগলের ঘর পরিষ্কার করুন", "time_range": "সকাল ১১ঃ০০ - ১২ঃ০০"},
+            ]
+        },
+        {
+            "phase": "দুপুর",
+            "tasks": [
+                {"description": "চারিতে পরিষ্কার পানি দিন এবং ছাগলকে বিশ্রাম নিতে দিন", "time_range": "দুপুর ১ঃ০০ - ৩ঃ০০"},
+                {"description": "সবুজ ঘাস খাওয়ান ({grass} কেজি", "time_range": "দুপুর ৩ঃ০০ - ৪ঃ০০"},
+                {"description": "দানাদার খাদ্য {feed} গ্রাম", "time_range": "বিকাল ৪ঃ০০ - ৫ঃ০০"},
+                {"description": "খড় খাওয়ান (চিটাগুড় মিশ্রিত পানি খড়ের উপর ছিটিয়ে দিন)", "time_range": "বিকাল ৫ঃ০০ - ৬ঃ০০"},
+                {"description": "প্রয়োজন অনুযায়ী সবুজ ঘাস দিন", "time_range": "বিকাল ৬ঃ০০ - সন্ধ্যা ৬ঃ৪৫"},
+            ]
+        },
+        {
+            "phase": "বিকাল",
+            "tasks": [
+                {"description": "ছাগলের ঘর পরিষ্কার করুন, রাতের জন্য কয়েল জ্বালিয়ে দিন, চারি পরিষ্কার করে পানি দিন", "time_range": "সন্ধ্যা ৭ঃ০০ - ৮ঃ০০"},
+            ]
+        }
+    ],
+}
+DEFAULT_SCHEDULE_TEMPLATE = [
+    {
+        "phase": "default",
+        "tasks": [
+            {"description": "{animal} এর জন্য সাধারণ কাজ", "time_range": "–"}
         ]
+    }
+]
+
+def register_animal(animal, phases, feed_thresholds, grass_brackets, grass_default, daily_gain_kg, ration):
+    """Add (or replace) an animal type: its schedule, feed and grass brackets,
+    expected daily gain and RATIONS entry, all of which must be given together."""
+    if list(feed_thresholds) != sorted(feed_thresholds) or list(grass_brackets) != sorted(grass_brackets):
+        raise ValueError(f"{animal}: brackets must be in ascending weight order")
+    missing = set(RATIONS[DEFAULT_ANIMAL]) - set(ration)
+    if missing:
+        raise ValueError(f"{animal}: ration is missing {', '.join(sorted(missing))}")
+    SCHEDULE_TEMPLATES[animal] = phases
+    FEED_LEVEL_THRESHOLDS[animal] = list(feed_thresholds)
+    GRASS_BRACKETS[animal] = ([tuple(b) for b in grass_brackets], grass_default)
+    DAILY_GAIN_KG[animal] = daily_gain_kg
+    RATIONS[animal] = dict(ration)
+    _render_schedule.cache_clear()
+
+def load_animals(path):
+    """Register the animal types in a JSON file: {"<type>": {<register_animal() arguments>}}."""
+    with open(path, encoding="utf-8") as f:
+        for animal, spec in json.load(f).items():
+            register_animal(animal, **spec)
+
+@lru_cache(maxsize=64)
+def _render_schedule(animal, feed, grass):
+    phases = SCHEDULE_TEMPLATES.get(animal, DEFAULT_SCHEDULE_TEMPLATE)
+    return [
+        {
+            "phase": phase["phase"],
+            "tasks": [
+                {
+                    "description": task["description"].format(grass=grass, feed=feed, animal=animal),
+                    "time_range": task["time_range"],
+                }
+                for task in phase["tasks"]
+            ],
+        }
+        for phase in phases
+    ]
 
-    elif animal == "goat":
-        return [
-            {
-                "phase": "সকাল",
-                "tasks": [
-                    {"description": "ছাগলের ঘর পরিষ্কার করুন, চারি পরিষ্কার করুন, ছাগলের পা হাঁটু পর্যন্ত ধুয়ে দিন", "time_range": "সকাল ৬ঃ০০ - ৭ঃ০০"},
-                    {"description": f"সবুজ ঘাস খাওয়ান {Grass(weight, animal)} কেজি", "time_range": "সকাল ৭ঃ০০ - ৮ঃ০০"},
-                    {"description": f"দানাদার খাদ্য {feed_level(weight, animal)} গ্রাম(একটি বাটিতে পরিমাপ করে দিন) + চিটাগুড় মিশ্রিত পানি (৫ গ্রাম / ৫ লিটার)", "time_range": "সকাল ৮ঃ০০ - ৯ঃ০০"},
-                    {"description": "খড় খাওয়ান (চিটাগুড় মিশ্রিত পানি খড়ের উপর ছিটিয়ে দিন)", "time_range": "সকাল ৯ঃ০০ - ১০ঃ০০"},
-                    {"description": "প্রয়োজন অনুযায়ী সবুজ ঘাস প্রদান করুন", "time_range": "সকাল ১০ঃ০০ - ১১ঃ০০"},
-                    {"description": "পানি দিয়ে চারি ধুয়ে দিন, ছাগলের ঘর পরিষ্কার করুন", "time_range": "সকাল ১১ঃ০০ - ১২ঃ০০"},
-                ]
-            },
-            {
-                "phase": "দুপুর",
-                "tasks": [
-                    {"description": "চারিতে পরিষ্কার পানি দিন এবং ছাগলকে বিশ্রাম নিতে দিন", "time_range": "দুপুর ১ঃ০০ - ৩ঃ০০"},
-                    {"description": f"সবুজ ঘাস খাওয়ান ({Grass(weight, animal)} কেজি", "time_range": "দুপুর ৩ঃ০০ - ৪ঃ০০"},
-                    {"description": f"দানাদার খাদ্য {feed_level(weight, animal)} গ্রাম", "time_range": "বিকাল ৪ঃ০০ - ৫ঃ০০"},
-                    {"description": "খড় খাওয়ান (চিটাগুড় মিশ্রিত পানি খড়ের উপর ছিটিয়ে দিন)", "time_range": "বিকাল ৫ঃ০০ - ৬ঃ০০"},
-                    {"description": "প্রয়োজন অনুযায়ী সবুজ ঘাস দিন", "time_range": "বিকাল ৬ঃ০০ - সন্ধ্যা ৬ঃ৪৫"},
-                ]
-            },
-            {
-                "phase": "বিকাল",
-                "tasks": [
-                    {"description": "ছাগলের ঘর পরিষ্কার করুন, রাতের জন্য কয়েল জ্বালিয়ে দিন, চারি পরিষ্কার করে পানি দিন", "time_range": "সন্ধ্যা ৭ঃ০০ - ৮ঃ০০"},
-                ]
-            }
-        ]
+def build_schedule(day, weight, animal):
+    # Only the (animal, feed bracket, grass bracket) triple affects the output,
+    # so schedules are rendered once per bracket and shared; don't mutate them.
+    return _render_schedule(animal, feed_level(weight, animal), Grass(weight, animal))
 
-    else:
-        return [
-            {
-                "phase": "default",
-                "tasks": [
-                    {"description": f"{animal} এর জন্য সাধারণ কাজ", "time_range": "–"}
-                ]
-            }
-        ]
+def schedule_task_count(weight, animal):
+    return len(build_schedule(None, weight, animal))
 
 # Routes
 @app.route('/')
@@ -186,13 +1153,15 @@ def signup():
     password = request.form.get('password')
     name = request.form.get('name')
     role = "user"  # Default role, can be changed manually in DB for admin
-    if users_col.find_one({'email': email}):
+    if users_col.find_one({'email': email}, {'_id': 1}):
         flash("User already exists", "warning")
         return redirect(url_for('home'))
-    pw_hash = bcrypt.hashpw(password.encode(), bcrypt.gensalt())
-    inserted = users_col.insert_one({'email': email, 'password': pw_hash, 'name': name, 'role': role})
+    pw_hash = hash_password(password)
+    inserted = users_col.insert_one({'email': email, 'password': pw_hash, 'name': name, 'name_lc': (name or '').lower(), 'role': role})
+    rotate_session()
     session['email'] = email
     session['user_id'] = str(inserted.inserted_id)
+    session['role'] = role
     flash("Signup successful!", "success")
     return redirect(url_for('projects'))
 
@@ -200,10 +1169,15 @@ def signup():
 def login():
     email = request.form.get('email')
     password = request.form.get('password')
-    user = users_col.find_one({'email': email})
-    if user and bcrypt.checkpw(password.encode(), user['password']):
+    user = users_col.find_one({'email': email}, {'password': 1, 'role': 1})
+    if user and check_password(password, user['password']):
+        if password_needs_rehash(user['password']):
+            users_col.update_one({'_id': user['_id']}, {'$set': {'password': hash_password(password)}})
+        rotate_session()
         session['email'] = email
         session['user_id'] = str(user['_id'])
+        session['role'] = user.get('role', 'user')
+        invalidate_principal(user['_id'])
         flash("Login successful!", "success")
         if user.get('role') == 'admin':
             return redirect(url_for('admin_dashboard'))
@@ -215,42 +1189,98 @@ def login():
 @app.route('/logout')
 def logout():
     session.clear()
+    rotate_session()
     flash("Logged out!", "info")
     return redirect(url_for('home'))
 
 @app.route('/profile')
 def profile():
-    email = session.get('email')
-    user = users_col.find_one({'email': email})
+    user = get_principal(session.get('user_id'))
     return render_template('profile.html', user=user)
 
 @app.route("/projects")
 def projects():
-    projs = list(proj_col.find({"owner": session["user_id"]}))
+    owner = session["user_id"]
+    projs = list(listing(proj_col.for_owner(owner)).find({"owner": owner}))
     days_map = {str(p["_id"]): days_since(p["purchase_date"]) for p in projs}
     return render_template("projects.html", projects=projs, days=days_map)
 
 @app.route("/projects/new", methods=["GET", "POST"])
 def new_project():
     if request.method == "POST":
+        now = datetime.datetime.utcnow()
         doc = {
             "today": date.today().isoformat(),
             "owner": session["user_id"],
             "name": request.form["name"].strip(),
+            "name_lc": request.form["name"].strip().lower(),
             "type": request.form["type"],
             "purchase_date": request.form["purchase_date"],
             "weight": float(request.form["weight"]),
             "feed_level": feed_level(float(request.form["weight"]), request.form["type"]),
             "target": 24 if request.form["type"] == "goat" else float(request.form["weight"])+120,
             "check_period": 30 if request.form["type"] == "cow" else 1,
-            "task_done": {},
-            "task_photo": {},
+            "weight_at": now,  # time of the reading behind "weight"
+            "updated_at": now,
         }
-        proj_col.insert_one(doc)
+        proj_col.for_owner(doc["owner"]).insert_one(doc)
         flash("Project created!", "success")
         return redirect(url_for("projects"))
     return render_template("new_project.html")
 
+def task_event_key(owner, proj_id, day, task_idx):
+    return {"owner": owner, "project_id": proj_id, "date": day, "task_idx": str(task_idx)}
+
+def load_task_events(projects, day, stale_ok=False):
+    """Return {project_id: (task_done, task_photo)} for one day, keyed by task index.
+
+    ``projects`` are project documents (at least _id and owner); there is one
+    query per shard they live on.
+    """
+    tasks = {proj["_id"]: ({}, {}) for proj in projects}
+    owners = {proj.get("owner") for proj in projects}
+    for shard, shard_owners in by_shard(owners).items():
+        coll = events_col.on(shard).stale_ok() if stale_ok else events_col.on(shard)
+        cursor = coll.find(
+            {"owner": {"$in": shard_owners}, "project_id": {"$in": list(tasks)}, "date": day},
+            {"_id": 0, "project_id": 1, "task_idx": 1, "done": 1, "photos": 1},
+        )
+        for event in cursor:
+            task_done, task_photo = tasks[event["project_id"]]
+            task_done[event["task_idx"]] = event.get("done", False)
+            if event.get("photos"):
+                task_photo[event["task_idx"]] = event["photos"]
+    return tasks
+
+def dashboard_refresh_pipeline(today):
+    """Feed-level rollover as one atomic update.
+
+    The check runs inside the update itself, so the dashboard needs a single
+    find_one_and_update and concurrent requests can't roll over twice. Daily
+    task state lives in task_events; the embedded task_done/task_photo dicts
+    of older documents are moved there by migrate_legacy_tasks().
+    """
+    today_start = datetime.datetime.combine(date.fromisoformat(today), datetime.time())
+    days = {"$floor": {"$divide": [
+        {"$subtract": [today_start, {"$dateFromString": {"dateString": "$purchase_date", "onError": None}}]},
+        86400000,
+    ]}}
+    rollover = {"$and": [
+        {"$ne": ["$_days", None]},
+        {"$ne": ["$_days", 0]},
+        {"$eq": [{"$mod": ["$_days", "$check_period"]}, 0]},
+        {"$ne": ["$last_check", "$_days"]},
+    ]}
+    projected_weight = {"$add": ["$weight", {"$cond": [{"$eq": ["$type", "cow"]}, 30, 0]}]}
+    return [
+        {"$set": {"_days": days}},
+        {"$set": {
+            "feed_level": {"$cond": [rollover, feed_level_expr(projected_weight, "$type"), "$feed_level"]},
+            "last_check": {"$cond": [rollover, "$_days", "$last_check"]},
+        }},
+        {"$unset": "_days"},
+    ]
+
 @app.route("/projects/<pid>/dashboard")
 def dashboard(pid):
     try:
@@ -259,70 +1289,59 @@ def dashboard(pid):
         flash("Invalid project ID", "danger")
         return redirect(url_for("projects"))
 
-    proj = proj_col.find_one({"_id": proj_id, "owner": session["user_id"]})
+    today = date.today().isoformat()
+    owner = session["user_id"]
+    proj = proj_col.for_owner(owner).find_one_and_update(
+        {"_id": proj_id, "owner": owner},
+        dashboard_refresh_pipeline(today),
+        return_document=ReturnDocument.AFTER,
+    )
     if not proj:
         flash("Not found!", "danger")
         return redirect(url_for("projects"))
 
     days = days_since(proj["purchase_date"])
-    today = date.today().isoformat()
     now = time_left_for_next_day_bangla()
     period = proj["check_period"]
     show_weight = (days % period == 0 and days != 0) or proj["type"] == "goat"
     days_left = (period - (days % period)) % period
 
-    # Feed level update check
-    if days % period == 0 and days != 0 and proj.get("last_check") != days:
-        new_level = feed_level(proj["weight"] + (30 if proj["type"] == "cow" else 0), proj["type"])
-        proj_col.update_one(
-            {"_id": proj["_id"]},
-            {"$set": {"feed_level": new_level, "last_check": days}}
-        )
-        proj = proj_col.find_one({"_id": proj["_id"]})  # Refresh after update
-
-    # --- Daily task_done & task_photo reset logic ---
-    # Store last_reset_date in project doc to track when last reset happened
-    last_reset_date = proj.get("task_done_reset_date")
-
-    if last_reset_date != today:
-        # Reset for new day: clear today's entries and update reset date
-        proj_col.update_one(
-            {"_id": proj["_id"]},
-            {
-                "$set": {
-                    "task_done": {today: {}},
-                    "task_photo": {today: {}},
-                    "task_done_reset_date": today
-                }
-            }
-        )
-        proj = proj_col.find_one({"_id": proj["_id"]})  # Refresh after reset
-
-    # Ensure keys exist in case no reset triggered (show today's data)
-    task_done = proj.get("task_done", {})
-    task_photo = proj.get("task_photo", {})
-    if today not in task_done:
-        task_done[today] = {}
-    if today not in task_photo:
-        task_photo[today] = {}
-
-    # Inject data to template
-    proj["task_done"] = task_done
-    proj["task_photo"] = task_photo
+    # Inject today's task state to template
+    proj["task_done"], proj["task_photo"] = load_task_events([proj], today)[proj_id]
     proj["task_done_date"] = today
 
     schedule = build_schedule(today, proj["weight"], proj["type"])
-
-    return render_template(
-        "dashboard.html",
-        project=proj,
-        schedule=schedule,
-        days=days,
-        show_weight_input=show_weight,
-        days_left=days_left,
-        today=today,
-        now=now
-    )
+    tasks_key = (pid, content_version(proj["weight"], proj["type"], proj["task_done"], proj["task_photo"]), today)
+
+    # The page only changes with the project, today's tasks and the date, so
+    # phones revalidate with If-None-Match and get a 304 instead of the page.
+    # Pages carrying a flash message are one-offs and never get an ETag.
+    etag = None
+    if "_flashes" not in session:
+        etag = content_version(proj, session.get("user_id"), today, asset_manifest(),
+                               template_rev("dashboard.html", "_dashboard_tasks.html", "profile.html"), live_events_enabled())
+    if etag and request.if_none_match.contains(etag):
+        response = app.response_class(status=304)
+    else:
+        response = make_response(render_template(
+            "dashboard.html",
+            project=proj,
+            schedule=schedule,
+            tasks_key=tasks_key,
+            days=days,
+            show_weight_input=show_weight,
+            days_left=days_left,
+            today=today,
+            now=now,
+            # The countdown runs in the browser towards this timestamp (ms)
+            next_day_ms=int(next_day_start().timestamp() * 1000),
+            live_events=live_events_enabled(),
+        ))
+    if etag:
+        response.set_etag(etag)
+        response.cache_control.private = True
+        response.cache_control.no_cache = True
+    return response
     
     
     
@@ -335,14 +1354,114 @@ def update_weight(pid):
         return redirect(url_for("projects"))
 
     weight = float(request.form["weight"])
-    proj = proj_col.find_one({"_id": proj_id, "owner": session["user_id"]})
+    owner = session["user_id"]
+    proj = find_project(proj_id, owner, {"type": 1})
     if proj:
-        proj_col.update_one({"_id": proj_id}, {"$set": {"weight": weight}})
         level = feed_level(weight, proj["type"])
-        proj_col.update_one({"_id": proj_id}, {"$set": {"feed_level": level}})
+        now = datetime.datetime.utcnow()
+        proj_col.for_owner(owner).update_one({"_id": proj_id, "owner": owner}, {"$set": {"weight": weight, "feed_level": level, "weight_at": now, "updated_at": now}})
+        weights_col.for_owner(owner).insert_one({"owner": owner, "project_id": proj_id, "weight": weight, "at": now, "source": "form"})
         flash("Weight updated!", "success")
     return redirect(url_for("dashboard", pid=pid))
 
+BULK_WEIGHT_MAX_ROWS = 5000
+BULK_WEIGHT_MAX_SKEW = datetime.timedelta(minutes=5)  # how far a reading's clock may run ahead of ours
+
+def parse_weight_rows():
+    # JSON: {"readings": [{"project_id": ..., "weight": ..., "at": ...}]} or a bare list;
+    # CSV: header row with project_id,weight[,at]
+    if request.mimetype == "text/csv":
+        return list(csv.DictReader(io.StringIO(request.get_data(as_text=True))))
+    payload = request.get_json(silent=True)
+    if isinstance(payload, dict):
+        payload = payload.get("readings")
+    return payload if isinstance(payload, list) else None
+
+def validate_weight_row(row):
+    if not isinstance(row, dict):
+        raise ValueError("row must be an object")
+    try:
+        proj_id = ObjectId(row.get("project_id"))
+    except (bson_errors.InvalidId, TypeError):
+        raise ValueError("invalid project_id")
+    try:
+        weight = float(row.get("weight"))
+    except (TypeError, ValueError):
+        raise ValueError("invalid weight")
+    if not (weight > 0 and math.isfinite(weight)):
+        raise ValueError("weight must be a positive number")
+    at = row.get("at")
+    if at:
+        try:
+            at = datetime.datetime.fromisoformat(str(at))
+        except ValueError:
+            raise ValueError("invalid at timestamp")
+        if at.tzinfo is not None:
+            at = at.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+        # A future reading would win the weight_at guard against every real one until then
+        if at > datetime.datetime.utcnow() + BULK_WEIGHT_MAX_SKEW:
+            raise ValueError("at is in the future")
+    else:
+        at = datetime.datetime.utcnow()
+    return proj_id, weight, at
+
+@app.route("/projects/weights/bulk", methods=["POST"])
+def bulk_update_weights():
+    """Ingest many scale/sensor readings at once and return a result per row."""
+    owner = session.get("user_id")
+    if not owner:
+        return jsonify(error="login required"), 401
+    rows = parse_weight_rows()
+    if rows is None:
+        return jsonify(error="expected a JSON list of readings or a CSV body"), 400
+    if len(rows) > BULK_WEIGHT_MAX_ROWS:
+        return jsonify(error=f"at most {BULK_WEIGHT_MAX_ROWS} rows per request"), 413
+
+    results, readings = [], []
+    for i, row in enumerate(rows):
+        try:
+            readings.append((i, *validate_weight_row(row)))
+            results.append({"row": i, "status": "ok"})
+        except ValueError as e:
+            results.append({"row": i, "status": "error", "error": str(e)})
+
+    # One ownership check for every project in the batch
+    owned = {p["_id"]: p["type"] for p in proj_col.for_owner(owner).find(
+        {"_id": {"$in": list({r[1] for r in readings})}, "owner": owner}, {"type": 1})}
+    latest, history = {}, []
+    for i, proj_id, weight, at in readings:
+        if proj_id not in owned:
+            results[i] = {"row": i, "status": "error", "error": "project not found"}
+            continue
+        results[i]["project_id"] = str(proj_id)
+        history.append({"owner": owner, "project_id": proj_id, "weight": weight, "at": at, "source": "bulk"})
+        if proj_id not in latest or at >= latest[proj_id][1]:
+            latest[proj_id] = (weight, at)
+
+    if latest:
+        # The project only takes a reading newer than the one it already has,
+        # so backfilled history never replaces a later form entry. Projects
+        # from before weight_at was recorded fall back to updated_at.
+        proj_col.for_owner(owner).bulk_write([
+            UpdateOne({"_id": proj_id, "owner": owner, "$or": [
+                {"weight_at": {"$lte": at}},
+                {"weight_at": {"$exists": False}, "updated_at": {"$not": {"$gt": at}}},
+            ]}, {"$set": {
+                "weight": weight,
+                "feed_level": feed_level(weight, owned[proj_id]),
+                "weight_at": at,
+                "updated_at": datetime.datetime.utcnow(),
+            }})
+            for proj_id, (weight, at) in latest.items()
+        ], ordered=False)
+        weights_col.for_owner(owner).insert_many(history, ordered=False)
+
+    return jsonify(
+        accepted=len(history),
+        rejected=len(results) - len(history),
+        results=results,
+    )
+
 @app.route("/projects/<pid>/tasks/save", methods=["POST"])
 def save_tasks(pid):
     try:
@@ -351,13 +1470,18 @@ def save_tasks(pid):
         flash("Invalid project ID", "danger")
         return redirect(url_for("projects"))
 
-    proj = proj_col.find_one({"_id": proj_id, "owner": session["user_id"]})
+    owner = session["user_id"]
+    proj = find_project(proj_id, owner, {"weight": 1, "type": 1})
     if proj:
-        done_indices = request.form.getlist("done")
-        done_dict = {str(i): False for i in range(len(build_schedule(days_since(proj["purchase_date"]), proj["weight"], proj["type"])))}
-        for idx in done_indices:
-            done_dict[idx] = True
-        proj_col.update_one({"_id": proj["_id"]}, {"$set": {"task_done": done_dict}})
+        today = date.today().isoformat()
+        done_indices = set(request.form.getlist("done"))
+        task_count = schedule_task_count(proj["weight"], proj["type"])
+        events_col.for_owner(owner).bulk_write([
+            UpdateOne(task_event_key(owner, proj_id, today, i), {"$set": {"done": str(i) in done_indices}}, upsert=True)
+            for i in range(task_count)
+        ])
+        for i in range(task_count):
+            publish_task_event(proj_id, i, done=str(i) in done_indices)
         flash("Tasks saved!", "success")
     return redirect(url_for("dashboard", pid=pid))
 
@@ -369,32 +1493,204 @@ def upload_photos(pid):
         flash("Invalid project ID", "danger")
         return redirect(url_for("projects"))
 
-    proj = proj_col.find_one({"_id": proj_id, "owner": session["user_id"]})
+    owner = session["user_id"]
+    proj = find_project(proj_id, owner, {"_id": 1})
     task_idx = request.form.get("task_idx")
     files = request.files.getlist("photos")
     if proj and task_idx:
-        task_photos = proj.get("task_photo", {}).get(task_idx, [])
-        if isinstance(task_photos, str):
-            task_photos = [task_photos]
         saved = []
         for file in files:
             if file and allowed(file.filename):
-                filename = f"{ObjectId()}_{secure_filename(file.filename)}"
-                saved.append(filename)
-        task_photos.extend(saved)
-
-        # Update photos
-        proj_col.update_one({"_id": proj["_id"]}, {"$set": {f"task_photo.{task_idx}": task_photos}})
+                saved.append(save_upload(file))
 
-        # Mark task as done if any photo uploaded
+        # Append photos and mark task as done if any photo uploaded
         if saved:
-            task_done = proj.get("task_done", {})
-            task_done[task_idx] = True
-            proj_col.update_one({"_id": proj["_id"]}, {"$set": {"task_done": task_done}})
+            event = events_col.for_owner(owner).find_one_and_update(
+                task_event_key(owner, proj_id, date.today().isoformat(), task_idx),
+                {"$push": {"photos": {"$each": saved}}, "$set": {"done": True}},
+                projection={"photos": 1},
+                upsert=True,
+                return_document=ReturnDocument.AFTER,
+            )
+            publish_task_event(proj_id, task_idx, done=True, photos=len(event["photos"]))
 
         flash(f"Uploaded {len(saved)} photo(s)! Task marked as done.", "success")
     return redirect(url_for("dashboard", pid=pid))
 
+# Offline task sync ==========================================================
+
+# Field devices queue task completions while offline and send them in one
+# request. Photos go up first through /projects/photos (or are skipped when a
+# HEAD on /photos/<sha256>.<ext> shows the server already has them) and are
+# referenced by name. Every sync carries a client-generated idempotency key,
+# so a retry after a dropped connection replays the stored response instead
+# of applying the batch twice.
+SYNC_MAX_ITEMS = 500
+SYNC_MAX_DAYS = 7  # how far back a queued completion may be dated
+SYNC_KEY_TTL = 24 * 3600  # seconds an idempotency key is remembered
+SYNC_CLAIM_TIMEOUT = 60  # seconds before a retry may take over a batch whose worker never finished
+SYNC_KEY_RE = re.compile(r"^[A-Za-z0-9_.:-]{8,100}$")
+
+def validate_sync_item(item, today):
+    if not isinstance(item, dict):
+        raise ValueError("item must be an object")
+    try:
+        proj_id = ObjectId(item.get("project_id"))
+    except (bson_errors.InvalidId, TypeError):
+        raise ValueError("invalid project_id")
+    try:
+        day = date.fromisoformat(str(item.get("date") or today.isoformat()))
+    except ValueError:
+        raise ValueError("invalid date")
+    if day > today or (today - day).days > SYNC_MAX_DAYS:
+        raise ValueError(f"date must be within the last {SYNC_MAX_DAYS} days")
+    try:
+        task_idx = int(item.get("task_idx"))
+    except (TypeError, ValueError):
+        raise ValueError("invalid task_idx")
+    photos = item.get("photos") or []
+    if not isinstance(photos, list) or not all(isinstance(p, str) and HASHED_NAME_RE.match(p) for p in photos):
+        raise ValueError("photos must be a list of uploaded photo names")
+    done = item.get("done", True)
+    if not isinstance(done, bool):
+        raise ValueError("done must be true or false")
+    return proj_id, day.isoformat(), task_idx, done or bool(photos), photos
+
+@app.route("/projects/photos", methods=["POST"])
+def upload_photo_batch():
+    """Store photos ahead of a sync and return their names; the sync takes the references."""
+    if not session.get("user_id"):
+        return jsonify(error="login required"), 401
+    files = [f for f in request.files.getlist("photos") if f and allowed(f.filename)]
+    if not files:
+        return jsonify(error="no photos (png, jpg, jpeg, gif) in the 'photos' field"), 400
+    return jsonify(photos=[save_upload(f, ref=False) for f in files])
+
+@app.route("/projects/tasks/sync", methods=["POST"])
+def sync_tasks():
+    """Apply a batch of task completions (any projects, recent days) exactly once."""
+    owner = session.get("user_id")
+    if not owner:
+        return jsonify(error="login required"), 401
+    payload = request.get_json(silent=True)
+    if not isinstance(payload, dict) or not isinstance(payload.get("items"), list):
+        return jsonify(error='expected {"idempotency_key": ..., "items": [...]}'), 400
+    key = request.headers.get("Idempotency-Key") or payload.get("idempotency_key")
+    if not isinstance(key, str) or not SYNC_KEY_RE.match(key):
+        return jsonify(error="idempotency_key must be 8-100 characters of A-Z a-z 0-9 _ . : -"), 400
+    items = payload["items"]
+    if len(items) > SYNC_MAX_ITEMS:
+        return jsonify(error=f"at most {SYNC_MAX_ITEMS} items per request"), 413
+
+    # Claim the key; a retry of a finished sync gets the stored response back
+    record_id = f"{owner}:{key}"
+    fingerprint = content_version(items)
+    now = datetime.datetime.utcnow()
+    try:
+        sync_col.insert_one({"_id": record_id, "fingerprint": fingerprint, "created": now, "claimed_at": now})
+    except DuplicateKeyError:
+        record = sync_col.find_one({"_id": record_id})
+        if record is None:
+            return jsonify(error="this batch is still being applied; retry shortly"), 409
+        if record.get("fingerprint") != fingerprint:
+            return jsonify(error="idempotency key was already used for a different batch"), 422
+        if "response" in record:
+            response = jsonify(record["response"])
+            response.headers["Idempotent-Replayed"] = "true"
+            return response
+        # The worker holding the claim may have died before storing the response;
+        # applying the batch again is safe, so a stale claim is taken over
+        stale = now - datetime.timedelta(seconds=SYNC_CLAIM_TIMEOUT)
+        taken = sync_col.find_one_and_update(
+            {"_id": record_id, "response": {"$exists": False}, "claimed_at": {"$lt": stale}},
+            {"$set": {"claimed_at": now}},
+        )
+        if taken is None:
+            return jsonify(error="this batch is still being applied; retry shortly"), 409
+
+    try:
+        body = apply_sync_items(owner, items)
+        sync_col.update_one({"_id": record_id}, {"$set": {"response": body}})
+    except Exception as e:
+        logging.error(f"Task sync {record_id} failed: {e}")
+        try:
+            sync_col.delete_one({"_id": record_id, "claimed_at": now})  # let the client retry with the same key
+        except Exception as cleanup_error:
+            logging.error(f"Could not release sync key {record_id}: {cleanup_error}")
+        return jsonify(error="could not save the batch; retry with the same idempotency key"), 503
+    return jsonify(body)
+
+def apply_sync_items(owner, items):
+    """Validate and write one sync batch; returns the response body."""
+    today = date.today()
+    results, changes = [], []
+    for i, item in enumerate(items):
+        try:
+            changes.append((i, *validate_sync_item(item, today)))
+            results.append({"item": i, "status": "ok"})
+        except ValueError as e:
+            results.append({"item": i, "status": "error", "error": str(e)})
+
+    # One ownership check and one photo lookup for the whole batch
+    events = events_col.for_owner(owner)
+    owned = {p["_id"]: p for p in proj_col.for_owner(owner).find(
+        {"_id": {"$in": list({c[1] for c in changes})}, "owner": owner}, {"weight": 1, "type": 1})}
+    names = list({name for c in changes for name in c[5]})
+    known = {b["_id"] for b in blobs_col.find({"_id": {"$in": names}}, {"_id": 1})} if names else set()
+    ops, applied = [], []
+    for i, proj_id, day, task_idx, done, photos in changes:
+        proj = owned.get(proj_id)
+        if not proj:
+            results[i] = {"item": i, "status": "error", "error": "project not found"}
+        elif not 0 <= task_idx < schedule_task_count(proj["weight"], proj["type"]):
+            results[i] = {"item": i, "status": "error", "error": "no such task"}
+        elif any(name not in known for name in photos):
+            results[i] = {"item": i, "status": "error", "error": "unknown photo; upload it first"}
+        else:
+            update = {"$set": {"done": done}}
+            if photos:
+                update["$addToSet"] = {"photos": {"$each": photos}}
+            ops.append(UpdateOne(task_event_key(owner, proj_id, day, task_idx), update, upsert=True))
+            applied.append((proj_id, day, task_idx, done, photos))
+
+    # Every photo name the batch really adds to an event takes a reference
+    # ($addToSet skips names the event already has), so a photo shared with
+    # another task isn't deleted when that task lets go of it. References are
+    # taken before the events are written, so upload GC can't sweep the file
+    # in between.
+    new_refs = {}
+    if any(photos for _, _, _, _, photos in applied):
+        current = {}
+        for event in events.find(
+                {"owner": owner, "project_id": {"$in": list({a[0] for a in applied})}, "date": {"$in": list({a[1] for a in applied})}},
+                {"project_id": 1, "date": 1, "task_idx": 1, "photos": 1}):
+            current[(event["project_id"], event["date"], event["task_idx"])] = set(event.get("photos") or [])
+        for proj_id, day, task_idx, done, photos in applied:
+            present = current.setdefault((proj_id, day, str(task_idx)), set())
+            for name in photos:
+                if name not in present:
+                    present.add(name)
+                    new_refs[name] = new_refs.get(name, 0) + 1
+    if new_refs:
+        blobs_col.bulk_write([
+            UpdateOne({"_id": name}, {"$inc": {"refs": n}, "$set": {"last_ref": datetime.datetime.utcnow()}})
+            for name, n in new_refs.items()
+        ], ordered=False)
+
+    if ops:
+        try:
+            events.bulk_write(ops, ordered=False)
+        except Exception:
+            if new_refs:
+                blobs_col.bulk_write([UpdateOne({"_id": name}, {"$inc": {"refs": -n}}) for name, n in new_refs.items()], ordered=False)
+            raise
+        today_iso = today.isoformat()
+        for proj_id, day, task_idx, done, photos in applied:
+            if day == today_iso:
+                publish_task_event(proj_id, task_idx, done=done, photos=len(photos) or None)
+
+    return {"applied": len(ops), "results": results}
+
 @app.route('/some_form')
 def some_form():
     return render_template('new_project.html', today=date.today().isoformat())
@@ -405,31 +1701,113 @@ def some_form():
 # admin======================================================================
 
 
+# Admin listing: sort key -> (field, direction). Every sort is tie-broken on _id
+# so the (value, _id) pair of the last row works as a keyset cursor.
+ADMIN_SORTS = {
+    "newest": ("_id", DESCENDING),
+    "oldest": ("_id", ASCENDING),
+    "name": ("name_lc", ASCENDING),
+    "type": ("type", ASCENDING),
+}
+ADMIN_PAGE_SIZE = 20
+ADMIN_MAX_PAGE_SIZE = 100
+ADMIN_MAX_OWNER_MATCHES = 1000
+
+def encode_cursor(value, oid):
+    raw = json.dumps([value, str(oid)]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(token):
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        value, oid = json.loads(raw)
+        return value, ObjectId(oid)
+    except (ValueError, TypeError, bson_errors.InvalidId):
+        return None
+
+def admin_search_filter(search_query):
+    if not search_query:
+        return {}
+    prefix = {"$regex": "^" + re.escape(search_query)}
+    owner_ids = [str(u["_id"]) for u in listing(users_col).find({"name_lc": prefix}, {"_id": 1}).limit(ADMIN_MAX_OWNER_MATCHES)]
+    clauses = [{"name_lc": prefix}, {"type": prefix}]
+    if owner_ids:
+        clauses.append({"owner": {"$in": owner_ids}})
+    return {"$or": clauses}
+
+def admin_cursor_filter(field, direction, cursor):
+    value, oid = cursor
+    op = "$gt" if direction == ASCENDING else "$lt"
+    if field == "_id":
+        return {"_id": {op: oid}}
+    return {"$or": [{field: {op: value}}, {field: value, "_id": {op: oid}}]}
+
 @app.route('/admin/dashboard')
 @admin_required
 def admin_dashboard():
     search_query = request.args.get('search', '').strip().lower()
-    users = {str(u['_id']): u for u in users_col.find()}
+    sort = request.args.get('sort', 'newest')
+    if sort not in ADMIN_SORTS:
+        sort = 'newest'
+    field, direction = ADMIN_SORTS[sort]
+    try:
+        per_page = int(request.args.get('per_page', ADMIN_PAGE_SIZE))
+    except ValueError:
+        per_page = ADMIN_PAGE_SIZE
+    per_page = max(1, min(per_page, ADMIN_MAX_PAGE_SIZE))
+
+    clauses = []
+    search_filter = admin_search_filter(search_query)
+    if search_filter:
+        clauses.append(search_filter)
+    after = request.args.get('after')
+    cursor = decode_cursor(after) if after else None
+    if cursor:
+        clauses.append(admin_cursor_filter(field, direction, cursor))
+    query = {"$and": clauses} if clauses else {}
+
+    sort_spec = [("_id", direction)] if field == "_id" else [(field, direction), ("_id", direction)]
+    # Fetch one extra row to know whether a next page exists. Each shard
+    # returns its own first page and the pages are merged, so the keyset
+    # cursor works across shards unchanged.
+    shards = [listing(coll) for coll in proj_col.shards()]
+    projects = find_sorted(shards, query, sort_spec, per_page + 1)
+    next_cursor = None
+    if len(projects) > per_page:
+        projects = projects[:per_page]
+        last = projects[-1]
+        next_cursor = encode_cursor(None if field == "_id" else last.get(field), last["_id"])
+
+    # One batched owner lookup for the page instead of loading every user
+    owner_ids = set()
+    for proj in projects:
+        try:
+            owner_ids.add(ObjectId(proj.get("owner")))
+        except (bson_errors.InvalidId, TypeError):
+            pass
+    users = {str(u['_id']): u for u in listing(users_col).find({"_id": {"$in": list(owner_ids)}}, {"name": 1, "email": 1})}
 
-    if not search_query:
-        projects = list(proj_col.find())
-    else:
-        projects = []
-        for proj in proj_col.find():
-            owner = users.get(proj.get('owner'))
-            owner_name = owner.get('name', '').lower() if owner else ''
-            if (search_query in proj.get('name', '').lower() or
-                search_query in proj.get('type', '').lower() or
-                search_query in owner_name):
-                projects.append(proj)
+    today = date.today().isoformat()
+    tasks = load_task_events(projects, today, stale_ok="_flashes" not in session)
 
     for proj in projects:
         owner_id = proj.get("owner")
         owner = users.get(owner_id)
         proj["owner_name"] = owner.get("name") if owner else "Unknown"
         proj["owner_email"] = owner.get("email") if owner else "Unknown"
+        proj["task_done"], proj["task_photo"] = tasks[proj["_id"]]
+        proj["tasks_key"] = (str(proj["_id"]), content_version(proj["task_done"], proj["task_photo"]), today)
 
-    return render_template('admin_dashboard.html', projects=projects, users=users, search=search_query)
+    return render_template(
+        'admin_dashboard.html',
+        projects=projects,
+        search=search_query,
+        sort=sort,
+        sorts=list(ADMIN_SORTS),
+        per_page=per_page,
+        next_cursor=next_cursor,
+        is_first_page=cursor is None,
+    )
 
 @app.route('/admin/projects/<pid>/edit', methods=['GET', 'POST'])
 @admin_required
@@ -440,11 +1818,17 @@ def admin_edit_project(pid):
         flash("Invalid project ID", "danger")
         return redirect(url_for('admin_dashboard'))
 
-    proj = proj_col.find_one({"_id": proj_id})
+    proj = locate_project(proj_id)
     if not proj:
         flash("Project not found", "danger")
         return redirect(url_for('admin_dashboard'))
 
+    owner = proj.get("owner")
+    projects, events = proj_col.for_owner(owner), events_col.for_owner(owner)
+    today = date.today().isoformat()
+    task_done, task_photo = load_task_events([proj], today)[proj_id]
+    proj["task_done"], proj["task_photo"] = task_done, task_photo
+
     if request.method == "POST":
         name = request.form.get("name", proj.get("name")).strip()
         animal_type = request.form.get("type", proj.get("type"))
@@ -459,79 +1843,56 @@ def admin_edit_project(pid):
         feed_lvl = feed_level(weight, animal_type)
 
         # Update base project fields
-        proj_col.update_one({"_id": proj_id}, {"$set": {
+        now = datetime.datetime.utcnow()
+        fields = {
             "name": name,
+            "name_lc": name.lower(),
             "type": animal_type,
             "purchase_date": purchase_date,
             "weight": weight,
             "feed_level": feed_lvl,
-        }})
-
-        # Update task_done and remove images if unchecked
-        task_done = proj.get("task_done", {})
-        task_photo = proj.get("task_photo", {})
+            "updated_at": now,
+        }
+        if weight != proj.get("weight"):
+            fields["weight_at"] = now
+        projects.update_one({"_id": proj_id, "owner": owner}, {"$set": fields})
 
+        # Update today's task events; unchecking a task removes its images
+        ops = []
         for task_index in task_done.keys():
             field_name = f"task_done_{task_index}"
             done_value = field_name in request.form
-            task_done[task_index] = done_value
+            update = {"$set": {"done": done_value}}
 
             if not done_value:
                 # Delete all images for this task from disk
-                photos_to_remove = task_photo.get(task_index, [])
-                for filename in photos_to_remove:
-                    path = os.path.join(app.config["UPLOAD_FOLDER"], filename)
-                    if os.path.exists(path):
-                        try:
-                            os.remove(path)
-                        except Exception as e:
-                            logging.error(f"Error deleting image {filename}: {e}")
-                # Remove photos for this task in DB
-                if task_index in task_photo:
-                    del task_photo[task_index]
-
-        # Update DB with cleaned task_done and task_photo
-        proj_col.update_one({"_id": proj_id}, {"$set": {"task_done": task_done, "task_photo": task_photo}})
+                for filename in task_photo.pop(task_index, []):
+                    remove_upload(filename)
+                update["$set"]["photos"] = []
+            ops.append(UpdateOne(task_event_key(owner, proj_id, today, task_index), update))
 
         # Handle photo deletions requested explicitly (checkboxes named delete_photo_<task_index>)
-        changed = False
         for task_index, photos in task_photo.items():
-            if not photos:
-                continue
-            delete_keys = request.form.getlist(f"delete_photo_{task_index}")
-            if delete_keys:
-                new_photos = [p for p in photos if p not in delete_keys]
-                if len(new_photos) != len(photos):
-                    for filename in delete_keys:
-                        path = os.path.join(app.config["UPLOAD_FOLDER"], filename)
-                        if os.path.exists(path):
-                            try:
-                                os.remove(path)
-                            except Exception as e:
-                                logging.error(f"Failed to delete file {filename}: {e}")
-                    task_photo[task_index] = new_photos
-                    changed = True
-        if changed:
-            proj_col.update_one({"_id": proj_id}, {"$set": {"task_photo": task_photo}})
+            delete_keys = set(request.form.getlist(f"delete_photo_{task_index}"))
+            removed = [p for p in photos if p in delete_keys]
+            if removed:
+                for filename in removed:
+                    remove_upload(filename)
+                ops.append(UpdateOne(task_event_key(owner, proj_id, today, task_index), {"$pull": {"photos": {"$in": removed}}}))
 
         # Handle new photo uploads per task (input names like photo_<task_index>)
         for key in request.files:
             if not key.startswith("photo_"):
                 continue
             task_index = key.split("_", 1)[1]
-            files = request.files.getlist(key)
-            if not files:
-                continue
-            current_photos = task_photo.get(task_index, [])
-            for file in files:
-                if file and allowed(file.filename):
-                    filename = f"{ObjectId()}_{secure_filename(file.filename)}"
-                    filepath = os.path.join(app.config["UPLOAD_FOLDER"], filename)
-                    file.save(filepath)
-                    current_photos.append(filename)
-            task_photo[task_index] = current_photos
-        # Save updated photos list after uploads
-        proj_col.update_one({"_id": proj_id}, {"$set": {"task_photo": task_photo}})
+            saved = [save_upload(file) for file in request.files.getlist(key) if file and allowed(file.filename)]
+            if saved:
+                ops.append(UpdateOne(task_event_key(owner, proj_id, today, task_index), {"$push": {"photos": {"$each": saved}}}, upsert=True))
+
+        if ops:
+            events.bulk_write(ops)
+            for event in events.find({"owner": owner, "project_id": proj_id, "date": today}, {"task_idx": 1, "done": 1, "photos": 1}):
+                publish_task_event(proj_id, event["task_idx"], done=event.get("done", False), photos=len(event.get("photos", [])))
 
         flash("Project updated successfully!", "success")
         return redirect(url_for('admin_dashboard'))
@@ -547,14 +1908,727 @@ def admin_delete_project(pid):
         flash("Invalid project ID", "danger")
         return redirect(url_for('admin_dashboard'))
 
-    result = proj_col.delete_one({"_id": proj_id})
-    if result.deleted_count:
+    proj = None
+    for coll in proj_col.shards():
+        proj = coll.find_one_and_delete({"_id": proj_id}, {"owner": 1})
+        if proj:
+            break
+    if proj:
+        owner = proj.get("owner")
+        events = events_col.for_owner(owner)
+        for event in events.find({"owner": owner, "project_id": proj_id, "photos.0": {"$exists": True}}, {"photos": 1}):
+            for filename in event["photos"]:
+                remove_upload(filename)
+        events.delete_many({"owner": owner, "project_id": proj_id})
+        mark_feed_report_dirty(proj.get("owner"))
         flash("Project deleted successfully!", "success")
     else:
         flash("Project not found or already deleted", "warning")
     return redirect(url_for('admin_dashboard'))
 
 
+# Feed report ================================================================
+
+# Daily ration per animal, matching the schedule: concentrate and grass are
+# given twice a day; goat concentrate in the schedule is in grams. Straw isn't
+# quantified by the schedule, so it's estimated as a share of body weight.
+RATIONS = {
+    "cow": {"concentrate_kg_per_level": 1.0, "concentrate_feedings": 2, "grass_feedings": 2, "straw_kg_per_100kg": 1.0},
+    "goat": {"concentrate_kg_per_level": 0.001, "concentrate_feedings": 2, "grass_feedings": 2, "straw_kg_per_100kg": 1.0},
+}
+# Expected gain (kg/day) until target; cows follow the 30 kg per 30-day check
+DAILY_GAIN_KG = {"cow": 1.0, "goat": 0.0}
+REPORT_HORIZONS = [0, 30, 90]
+REPORT_REFRESH_INTERVAL = 60  # seconds between incremental refreshes
+REPORT_PAGE_LIMIT = 200
+
+# More animal types, from a JSON file read at startup (see load_animals)
+ANIMALS_FILE = os.getenv("ANIMALS_FILE")
+if ANIMALS_FILE:
+    load_animals(ANIMALS_FILE)
+
+def ration_value(key, animal):
+    return animal_expr(RATIONS, animal, lambda ration: ration[key])
+
+def daily_feed_exprs(weight, animal):
+    return {
+        "concentrate_kg": {"$multiply": [feed_level_expr(weight, animal),
+                                         ration_value("concentrate_kg_per_level", animal),
+                                         ration_value("concentrate_feedings", animal)]},
+        "grass_kg": {"$multiply": [grass_expr(weight, animal), ration_value("grass_feedings", animal)]},
+        "straw_kg": {"$multiply": [weight, ration_value("straw_kg_per_100kg", animal), 0.01]},
+    }
+
+def feed_report_pipeline(match):
+    """Per-owner daily feed requirements now and at each REPORT_HORIZONS day."""
+    gain = animal_expr(DAILY_GAIN_KG, "$type", lambda kg: kg)
+    weight = {"$ifNull": ["$weight", 0]}
+    ceiling = {"$max": [{"$ifNull": ["$target", 0]}, weight]}
+    project, group = {"owner": 1, "type": 1}, {"_id": "$owner", "animals": {"$sum": 1}}
+    for h in REPORT_HORIZONS:
+        projected = {"$min": [{"$add": [weight, {"$multiply": [gain, h]}]}, ceiling]}
+        for name, expr in daily_feed_exprs(projected, "$type").items():
+            project[f"d{h}_{name}"] = expr
+            group[f"d{h}_{name}"] = {"$sum": f"$d{h}_{name}"}
+    for animal in RATIONS:
+        group[animal] = {"$sum": {"$cond": [{"$eq": ["$type", animal]}, 1, 0]}}
+    return [{"$match": match}, {"$project": project}, {"$group": group}]
+
+def mark_feed_report_dirty(owner):
+    meta_col.update_one({"_id": "feed_report"}, {"$addToSet": {"dirty_owners": owner}}, upsert=True)
+
+def refresh_feed_report(full=False):
+    """Bring feed_report up to date, re-aggregating only owners that changed.
+
+    Owners are picked up from projects whose updated_at is newer than the last
+    refresh, plus owners whose projects were deleted (dirty_owners).
+    """
+    started = datetime.datetime.utcnow()
+    meta = meta_col.find_one({"_id": "feed_report"}) or {}
+    # An owner's projects all live on one shard, so per-shard groups are final
+    if full or not meta.get("refreshed_at"):
+        owners = None
+        parts = scatter(lambda coll: list(coll.aggregate(feed_report_pipeline({}))), proj_col.shards())
+    else:
+        # Small overlap so writes racing the previous refresh aren't missed
+        since = meta["refreshed_at"] - datetime.timedelta(seconds=5)
+        owners = set()
+        for part in scatter(lambda coll: coll.distinct("owner", {"updated_at": {"$gte": since}}), proj_col.shards()):
+            owners.update(part)
+        owners.update(meta.get("dirty_owners", []))
+        parts = [list(proj_col.on(shard).aggregate(feed_report_pipeline({"owner": {"$in": shard_owners}})))
+                 for shard, shard_owners in by_shard(owners).items()]
+    rows = [row for part in parts for row in part]
+
+    ops = [UpdateOne({"_id": row["_id"]}, {"$set": row}, upsert=True) for row in rows]
+    if ops:
+        report_col.bulk_write(ops, ordered=False)
+    # Owners that no longer have any projects
+    present = {row["_id"] for row in rows}
+    if owners is None:
+        report_col.delete_many({"_id": {"$nin": list(present)}})
+    elif owners - present:
+        report_col.delete_many({"_id": {"$in": list(owners - present)}})
+    meta_col.update_one(
+        {"_id": "feed_report"},
+        {"$set": {"refreshed_at": started}, "$pull": {"dirty_owners": {"$in": list(owners or meta.get("dirty_owners", []))}}},
+        upsert=True,
+    )
+    return started
+
+def feed_totals(row, horizon):
+    totals = {name: round(row.get(f"d{horizon}_{name}", 0), 3) for name in ("concentrate_kg", "grass_kg", "straw_kg")}
+    if horizon:
+        # Amount needed over the whole window (trapezoid between now and the horizon)
+        for name in ("concentrate_kg", "grass_kg", "straw_kg"):
+            totals[f"window_{name}"] = round(horizon * (row.get(f"d0_{name}", 0) + row.get(f"d{horizon}_{name}", 0)) / 2, 3)
+    return totals
+
+def build_feed_report(refresh=None, limit=None):
+    meta = meta_col.find_one({"_id": "feed_report"}, {"refreshed_at": 1, "dirty_owners": 1}) or {}
+    refreshed_at = meta.get("refreshed_at")
+    stale = not refreshed_at or (datetime.datetime.utcnow() - refreshed_at).total_seconds() > REPORT_REFRESH_INTERVAL
+    if refresh == "full" or stale or meta.get("dirty_owners"):
+        refreshed_at = refresh_feed_report(full=refresh == "full")
+
+    cursor = report_col.find().sort("d0_concentrate_kg", DESCENDING)
+    if limit:
+        cursor = cursor.limit(limit)
+    rows = list(cursor)
+    fleet = dict(report_col.aggregate([{"$group": {
+        "_id": None,
+        "animals": {"$sum": "$animals"},
+        **{animal: {"$sum": f"${animal}"} for animal in RATIONS},
+        **{f"d{h}_{name}": {"$sum": f"$d{h}_{name}"}
+           for h in REPORT_HORIZONS for name in ("concentrate_kg", "grass_kg", "straw_kg")},
+    }}]).next() if rows else {})
+
+    owner_ids = []
+    for row in rows:
+        try:
+            owner_ids.append(ObjectId(row["_id"]))
+        except (bson_errors.InvalidId, TypeError):
+            pass
+    users = {str(u["_id"]): u for u in users_col.find({"_id": {"$in": owner_ids}}, {"name": 1, "email": 1})}
+
+    def summarize(row):
+        return {
+            "animals": row.get("animals", 0),
+            "by_type": {animal: row.get(animal, 0) for animal in RATIONS},
+            "horizons": {str(h): feed_totals(row, h) for h in REPORT_HORIZONS},
+        }
+
+    return {
+        "refreshed_at": refreshed_at.isoformat() if refreshed_at else None,
+        "horizons": REPORT_HORIZONS,
+        "fleet": summarize(fleet),
+        "owners": [
+            {
+                "owner": row["_id"],
+                "owner_name": users.get(row["_id"], {}).get("name", "Unknown"),
+                "owner_email": users.get(row["_id"], {}).get("email", "Unknown"),
+                **summarize(row),
+            }
+            for row in rows
+        ],
+    }
+
+@app.route('/admin/reports/feed')
+@admin_required
+def admin_feed_report():
+    report = build_feed_report(refresh=request.args.get('refresh'), limit=REPORT_PAGE_LIMIT)
+    return render_template('admin_feed_report.html', report=report, limit=REPORT_PAGE_LIMIT)
+
+@app.route('/admin/reports/feed.json')
+@admin_required
+def admin_feed_report_json():
+    return jsonify(build_feed_report(refresh=request.args.get('refresh')))
+
+
+# Growth forecasts ===========================================================
+
+def forecast_date(days, today):
+    if days is None or not days < float("inf"):
+        return None
+    return (today + datetime.timedelta(days=math.ceil(days))).isoformat()
+
+def refresh_forecasts(project_ids=None, full=False, owner=None):
+    """Refit growth curves for projects with new readings (or the given ones).
+
+    All selected projects are fitted in one NumPy batch (see forecast.py) and
+    the results are upserted into the forecasts collection.
+    """
+    import numpy as np
+    import forecast  # loaded on demand so NumPy stays off the cold-start path
+
+    started = datetime.datetime.utcnow()
+    since = None
+    if project_ids is None and not full:
+        meta = meta_col.find_one({"_id": "forecasts"}) or {}
+        if meta.get("refreshed_at"):
+            since = meta["refreshed_at"] - datetime.timedelta(seconds=5)
+
+    # Projects and readings from every shard (or just the owner's) go into one batch
+    projects, shard_of, index_of = [], [], {}
+    animal_idx, days, weights = [], [], []
+    for shard in ([owner_shard(owner)] if owner is not None else range(len(MONGO_SHARDS))):
+        query = {}
+        if project_ids is not None:
+            query = {"_id": {"$in": list(project_ids)}}
+            if owner is not None:
+                query["owner"] = owner
+        elif since:
+            changed = set(weights_col.on(shard).distinct("project_id", {"_id": {"$gte": ObjectId.from_datetime(since)}}))
+            changed.update(p["_id"] for p in proj_col.on(shard).find({"updated_at": {"$gte": since}}, {"_id": 1}))
+            query = {"_id": {"$in": list(changed)}}
+        found = list(proj_col.on(shard).find(query, {"owner": 1, "type": 1, "target": 1, "weight": 1, "updated_at": 1}))
+        for p in found:
+            index_of[p["_id"]] = len(projects)
+            projects.append(p)
+            shard_of.append(shard)
+        if query and not found:
+            continue
+        readings = weights_col.on(shard).find(
+            {"owner": {"$in": list({p.get("owner") for p in found})}, "project_id": {"$in": [p["_id"] for p in found]}} if query else {},
+            {"_id": 0, "project_id": 1, "weight": 1, "at": 1},
+        )
+        for reading in readings:
+            i = index_of.get(reading["project_id"])
+            if i is not None:
+                animal_idx.append(i)
+                days.append((reading["at"] - started).total_seconds() / 86400)
+                weights.append(reading["weight"])
+    # Projects without any recorded reading start from their current weight
+    seen = set(animal_idx)
+    for i, p in enumerate(projects):
+        if i not in seen and p.get("weight") is not None:
+            animal_idx.append(i)
+            days.append(((p.get("updated_at") or started) - started).total_seconds() / 86400)
+            weights.append(p["weight"])
+    loaded = datetime.datetime.utcnow()
+
+    if projects:
+        types = np.array([p.get("type") if p.get("type") in FEED_LEVEL_THRESHOLDS else DEFAULT_ANIMAL for p in projects])
+        default_gain = np.array([animal_value(DAILY_GAIN_KG, t) for t in types], dtype=float)
+        gain, weight_now = forecast.fit_growth(animal_idx, days, weights, len(projects), default_gain)
+        targets = np.array([p.get("target") or np.nan for p in projects], dtype=float)
+        to_target = np.where(np.isnan(targets), np.inf, forecast.days_until(weight_now, gain, np.nan_to_num(targets)))
+        next_level = np.zeros(len(projects), dtype=int)
+        boundary = np.full(len(projects), np.inf)
+        for animal, thresholds in FEED_LEVEL_THRESHOLDS.items():
+            mask = types == animal
+            next_level[mask], boundary[mask] = forecast.next_threshold(weight_now[mask], thresholds)
+        to_next = forecast.days_until(weight_now, gain, boundary)
+    fitted = datetime.datetime.utcnow()
+
+    today = date.today()
+    ops = {}
+    for i, p in enumerate(projects):
+        ops.setdefault(shard_of[i], []).append(UpdateOne({"_id": p["_id"], "owner": p.get("owner")}, {"$set": {
+            "gain_kg_per_day": round(float(gain[i]), 3),
+            "weight_now": None if np.isnan(weight_now[i]) else round(float(weight_now[i]), 2),
+            "target_date": forecast_date(float(to_target[i]), today),
+            "next_feed_level": int(next_level[i]) or None,
+            "next_feed_level_date": forecast_date(float(to_next[i]), today) if next_level[i] else None,
+            "computed_at": started,
+        }}, upsert=True))
+    for shard, shard_ops in ops.items():
+        forecasts_col.on(shard).bulk_write(shard_ops, ordered=False)
+    if project_ids is None:
+        meta_col.update_one({"_id": "forecasts"}, {"$set": {"refreshed_at": started}}, upsert=True)
+    return {
+        "projects": len(projects),
+        "readings": len(weights),
+        "load_seconds": round((loaded - started).total_seconds(), 3),
+        "fit_seconds": round((fitted - loaded).total_seconds(), 3),
+    }
+
+def get_forecast(proj_id, owner):
+    forecasts = forecasts_col.for_owner(owner)
+    doc = forecasts.find_one({"_id": proj_id, "owner": owner})
+    if doc and not weights_col.for_owner(owner).find_one(
+            {"owner": owner, "project_id": proj_id, "_id": {"$gte": ObjectId.from_datetime(doc["computed_at"])}}, {"_id": 1}):
+        return doc
+    refresh_forecasts([proj_id], owner=owner)
+    return forecasts.find_one({"_id": proj_id, "owner": owner})
+
+@app.route("/projects/<pid>/forecast")
+def project_forecast(pid):
+    try:
+        proj_id = ObjectId(pid)
+    except bson_errors.InvalidId:
+        return jsonify(error="invalid project id"), 400
+    owner = session.get("user_id")
+    if not find_project(proj_id, owner, {"_id": 1}):
+        return jsonify(error="not found"), 404
+    doc = get_forecast(proj_id, owner) or {}
+    doc.pop("_id", None)
+    doc.pop("owner", None)
+    doc.pop("computed_at", None)
+    return jsonify(doc)
+
+@app.route('/admin/forecasts/refresh', methods=['POST'])
+@admin_required
+def admin_refresh_forecasts():
+    return jsonify(refresh_forecasts(full=request.args.get('full') == '1'))
+
+
+# Tenant shards ==============================================================
+
+# After MONGO_SHARDS changes, owners whose data sits on a shard they no longer
+# hash to are moved: their documents are copied to the new shard and then
+# deleted from the old one. Requests for a moved owner already go to the new
+# shard, so run this right after deploying the new shard list. Documents the
+# new shard already has (written there since the deploy) are kept.
+REBALANCE_BATCH = 1000
+
+def copy_documents(source, target, query):
+    batch, copied = [], 0
+    for doc in source.find(query):
+        batch.append(doc)
+        if len(batch) >= REBALANCE_BATCH:
+            copied += insert_missing(target, batch)
+            batch = []
+    if batch:
+        copied += insert_missing(target, batch)
+    return copied
+
+def insert_missing(coll, docs):
+    try:
+        return len(coll.insert_many(docs, ordered=False).inserted_ids)
+    except BulkWriteError as e:
+        if any(err.get("code") != 11000 for err in e.details.get("writeErrors", [])):
+            raise
+        return e.details.get("nInserted", 0)
+
+def rebalance_tenants(dry_run=False):
+    stats = {"owners_moved": 0, "documents_copied": 0, "misplaced": []}
+    for shard in range(len(MONGO_SHARDS)):
+        for owner in proj_col.on(shard).distinct("owner"):
+            home = owner_shard(owner)
+            if home == shard:
+                continue
+            stats["misplaced"].append({"owner": owner, "from": MONGO_SHARDS[shard][0], "to": MONGO_SHARDS[home][0]})
+            if dry_run:
+                continue
+            for coll in TENANT_COLLECTIONS:
+                stats["documents_copied"] += copy_documents(coll.on(shard), coll.on(home), {"owner": owner})
+            for coll in TENANT_COLLECTIONS:
+                coll.on(shard).delete_many({"owner": owner})
+            stats["owners_moved"] += 1
+            logging.info(f"Moved owner {owner} from shard {MONGO_SHARDS[shard][0]} to {MONGO_SHARDS[home][0]}")
+    return stats
+
+@app.route('/admin/shards/rebalance', methods=['POST'])
+@admin_required
+def admin_rebalance_shards():
+    return jsonify(rebalance_tenants(dry_run=request.args.get('dry_run') == '1'))
+
+@app.route('/admin/migrate', methods=['POST'])
+@admin_required
+def admin_migrate():
+    return jsonify(migrate(force=request.args.get('force') == '1'))
+
+
+# Upload garbage collection ==================================================
+
+# Files in static/uploads that nothing references any more (photos of deleted
+# projects, photos dropped by the old daily reset, half-finished temp files)
+# are swept by a background job. Orphans are moved to ORPHAN_FOLDER, or deleted
+# with UPLOAD_GC_MODE=delete. Files younger than UPLOAD_GC_GRACE are left
+# alone so uploads in flight are never touched. Quarantined files are deleted
+# for good once they have sat in ORPHAN_FOLDER for UPLOAD_GC_RETENTION.
+UPLOAD_GC_INTERVAL = int(os.getenv("UPLOAD_GC_INTERVAL", "21600"))  # seconds; 0 disables the background job
+UPLOAD_GC_GRACE = int(os.getenv("UPLOAD_GC_GRACE", "3600"))
+UPLOAD_GC_MODE = os.getenv("UPLOAD_GC_MODE", "quarantine")
+UPLOAD_GC_RETENTION = int(os.getenv("UPLOAD_GC_RETENTION", str(14 * 86400)))  # seconds; 0 keeps quarantined files
+UPLOAD_GC_BATCH = 500
+ORPHAN_FOLDER = os.path.join(os.getcwd(), "upload_orphans")
+_upload_gc_started = False
+_upload_gc_lock = threading.Lock()
+
+def referenced_uploads():
+    """Every filename a task event (or a not yet migrated project) points to."""
+    names = set()
+    for shard in range(len(MONGO_SHARDS)):
+        for event in events_col.on(shard).find({"photos.0": {"$exists": True}}, {"_id": 0, "photos": 1}, batch_size=1000):
+            names.update(event["photos"])
+        for proj in proj_col.on(shard).find({"task_photo": {"$exists": True}}, {"_id": 0, "task_photo": 1}):
+            for photos in (proj["task_photo"] or {}).values():
+                names.update([photos] if isinstance(photos, str) else photos)
+    return names
+
+def old_files(folder, cutoff):
+    """Stream (name, size) of the regular files in ``folder`` last modified before ``cutoff``."""
+    try:
+        entries = os.scandir(folder)
+    except FileNotFoundError:
+        return
+    with entries:
+        for entry in entries:
+            if entry.is_file(follow_symlinks=False):
+                st = entry.stat(follow_symlinks=False)
+                if st.st_mtime < cutoff:
+                    yield entry.name, st.st_size
+
+def sweep_orphans(batch, mode, recent_cutoff, stats):
+    """Quarantine (then, in delete mode, remove) one batch of orphaned uploads.
+
+    A deduplicated photo can be referenced again at any time, so after moving
+    the files aside, blobs referenced since ``recent_cutoff`` are put back.
+    """
+    os.makedirs(ORPHAN_FOLDER, exist_ok=True)
+    moved = []
+    for name, size in batch:
+        try:
+            os.replace(os.path.join(UPLOAD_FOLDER, name), os.path.join(ORPHAN_FOLDER, name))
+            os.utime(os.path.join(ORPHAN_FOLDER, name))  # retention counts from the move
+            moved.append((name, size))
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logging.error(f"Upload GC could not move {name}: {e}")
+    hashed = [name for name, _ in moved if HASHED_NAME_RE.match(name)]
+    recent = {b["_id"] for b in blobs_col.find({"_id": {"$in": hashed}, "last_ref": {"$gte": recent_cutoff}}, {"_id": 1})}
+    for name in recent:
+        os.replace(os.path.join(ORPHAN_FOLDER, name), os.path.join(UPLOAD_FOLDER, name))
+    stats["restored"] += len(recent)
+    blobs_col.delete_many({"_id": {"$in": [n for n in hashed if n not in recent]}, "last_ref": {"$not": {"$gte": recent_cutoff}}})
+    for name, size in moved:
+        if name in recent:
+            continue
+        if mode == "delete":
+            try:
+                os.remove(os.path.join(ORPHAN_FOLDER, name))
+            except OSError as e:
+                logging.error(f"Upload GC could not delete {name}: {e}")
+                continue
+        stats["removed"] += 1
+        stats["bytes"] += size
+
+def collect_upload_garbage(dry_run=False, mode=None):
+    """Find upload files nothing references and quarantine or delete them.
+
+    The referenced names are loaded once into a set; the upload folders are
+    streamed and orphans handled in batches of UPLOAD_GC_BATCH. Returns counts
+    and timings for the run.
+    """
+    mode = mode or UPLOAD_GC_MODE
+    started = time.monotonic()
+    cutoff = time.time() - UPLOAD_GC_GRACE
+    recent_cutoff = datetime.datetime.utcnow() - datetime.timedelta(seconds=UPLOAD_GC_GRACE)
+    referenced = referenced_uploads()
+    loaded = time.monotonic()
+    stats = {"mode": mode, "dry_run": dry_run, "referenced": len(referenced), "scanned": 0,
+             "orphans": 0, "removed": 0, "restored": 0, "bytes": 0, "thumbs_removed": 0, "temp_removed": 0,
+             "quarantine_purged": 0, "quarantine_purged_bytes": 0}
+
+    orphans = set()
+    batch = []
+    for name, size in old_files(UPLOAD_FOLDER, cutoff):
+        stats["scanned"] += 1
+        if name in referenced:
+            continue
+        stats["orphans"] += 1
+        if dry_run:
+            orphans.add(name)
+            stats["bytes"] += size
+            continue
+        batch.append((name, size))
+        if len(batch) >= UPLOAD_GC_BATCH:
+            sweep_orphans(batch, mode, recent_cutoff, stats)
+            batch = []
+    if batch:
+        sweep_orphans(batch, mode, recent_cutoff, stats)
+
+    # Thumbnails are derived data: drop any whose original is gone
+    originals = {os.path.splitext(name)[0] for name in os.listdir(UPLOAD_FOLDER)} if os.path.isdir(UPLOAD_FOLDER) else set()
+    originals.difference_update(os.path.splitext(name)[0] for name in orphans)
+    for folder, counter in ((THUMB_FOLDER, "thumbs_removed"), (UPLOAD_TMP_FOLDER, "temp_removed")):
+        for name, size in old_files(folder, cutoff):
+            if folder == THUMB_FOLDER and os.path.splitext(name)[0] in originals:
+                continue
+            stats[counter] += 1
+            if not dry_run:
+                try:
+                    os.remove(os.path.join(folder, name))
+                except OSError as e:
+                    logging.error(f"Upload GC could not delete {name}: {e}")
+
+    # Quarantine is a safety net, not storage
+    if UPLOAD_GC_RETENTION > 0:
+        for name, size in old_files(ORPHAN_FOLDER, time.time() - UPLOAD_GC_RETENTION):
+            if not dry_run:
+                try:
+                    os.remove(os.path.join(ORPHAN_FOLDER, name))
+                except OSError as e:
+                    logging.error(f"Upload GC could not purge {name}: {e}")
+                    continue
+            stats["quarantine_purged"] += 1
+            stats["quarantine_purged_bytes"] += size
+
+    finished = time.monotonic()
+    stats["load_seconds"] = round(loaded - started, 3)
+    stats["scan_seconds"] = round(finished - loaded, 3)
+    stats["files_per_second"] = round(stats["scanned"] / max(finished - loaded, 1e-6))
+    logging.info(f"Upload GC: {stats}")
+    if not dry_run:
+        meta_col.update_one({"_id": "upload_gc"}, {"$set": {"last_run": datetime.datetime.utcnow(), "stats": stats}}, upsert=True)
+    return stats
+
+def claim_upload_gc():
+    """Take the next scheduled run; only one process per interval gets it."""
+    now = datetime.datetime.utcnow()
+    try:
+        meta_col.update_one(
+            {"_id": "upload_gc", "next_run": {"$not": {"$gt": now}}},
+            {"$set": {"next_run": now + datetime.timedelta(seconds=UPLOAD_GC_INTERVAL)}},
+            upsert=True,
+        )
+    except DuplicateKeyError:
+        return False  # another process holds this interval
+    return True
+
+def upload_gc_loop():
+    while True:
+        time.sleep(min(UPLOAD_GC_INTERVAL, 600))
+        try:
+            if claim_upload_gc():
+                collect_upload_garbage()
+        except Exception as e:
+            logging.error(f"Upload GC failed: {e}")
+
+def ensure_upload_gc():
+    global _upload_gc_started
+    if UPLOAD_GC_INTERVAL > 0 and not _upload_gc_started:
+        with _upload_gc_lock:
+            if not _upload_gc_started:
+                threading.Thread(target=upload_gc_loop, name="upload-gc", daemon=True).start()
+                _upload_gc_started = True
+
+@app.route('/admin/uploads/gc', methods=['POST'])
+@admin_required
+def admin_upload_gc():
+    mode = request.args.get('mode')
+    if mode not in (None, "quarantine", "delete"):
+        return jsonify(error="mode must be quarantine or delete"), 400
+    return jsonify(collect_upload_garbage(dry_run=request.args.get('dry_run') == '1', mode=mode))
+
+
+@app.route('/metrics')
+def metrics_endpoint():
+    if not METRICS_ENABLED:
+        abort(404)
+    token = request.headers.get("Authorization", "")
+    if METRICS_TOKEN and secrets.compare_digest(token.encode(), f"Bearer {METRICS_TOKEN}".encode()):
+        return render_metrics()
+    return admin_required(render_metrics)()
+
+def render_metrics():
+    if request.args.get("format") == "json":
+        return jsonify(registry.snapshot())
+    return Response(registry.render(), mimetype="text/plain; version=0.0.4")
+
+
+# Live dashboard updates =====================================================
+
+# Server-sent events: each dashboard subscribes to its project's stream. Task
+# changes are published in-process; with MONGO_CHANGE_STREAMS=1 (replica set
+# required) they come from a task_events change stream instead, so every
+# worker and instance sees every change.
+#
+# An open stream holds a worker (or a serverless invocation) under plain WSGI,
+# and the in-process broker never hears about changes made by other workers,
+# so dashboards only subscribe when served by asgi.py (which sets
+# ASYNC_EVENTS) or when change streams are on. Otherwise the countdown runs
+# without a stream and the page reloads itself at the day rollover.
+SSE_HEARTBEAT = 15  # seconds
+SSE_MAX_SECONDS = 300  # streams end after this; EventSource reconnects
+USE_CHANGE_STREAMS = os.getenv("MONGO_CHANGE_STREAMS") == "1"
+ASYNC_EVENTS = False  # streams cost a coroutine, not a thread; set by asgi.py
+
+def live_events_enabled():
+    return ASYNC_EVENTS or USE_CHANGE_STREAMS
+
+class EventBroker:
+    def __init__(self):
+        self._subscribers = {}
+        self._lock = threading.Lock()
+
+    def _add(self, key, q, deliver):
+        with self._lock:
+            self._subscribers.setdefault(key, {})[q] = deliver
+        return q
+
+    def subscribe(self, key):
+        q = queue.Queue(maxsize=100)
+        return self._add(key, q, q.put_nowait)
+
+    def subscribe_async(self, key, loop):
+        """Like subscribe, but returns an asyncio.Queue owned by ``loop``."""
+        q = asyncio.Queue(maxsize=100)
+
+        def offer(event):
+            try:
+                q.put_nowait(event)
+            except asyncio.QueueFull:
+                pass
+
+        return self._add(key, q, lambda event: loop.call_soon_threadsafe(offer, event))
+
+    def unsubscribe(self, key, q):
+        with self._lock:
+            subscribers = self._subscribers.get(key)
+            if subscribers:
+                subscribers.pop(q, None)
+                if not subscribers:
+                    del self._subscribers[key]
+
+    def publish(self, key, event):
+        with self._lock:
+            subscribers = list(self._subscribers.get(key, {}).values())
+        for deliver in subscribers:
+            try:
+                deliver(event)
+            except (queue.Full, RuntimeError):
+                pass  # slow client or closed loop; it resyncs on the next page load
+
+broker = EventBroker()
+_watcher_started = False
+_watcher_lock = threading.Lock()
+
+def task_event_payload(task_idx, done, photos=None):
+    payload = {"type": "task", "task_idx": str(task_idx), "done": done}
+    if photos is not None:
+        payload["photos"] = photos
+    return payload
+
+def publish_task_event(proj_id, task_idx, done, photos=None):
+    if not USE_CHANGE_STREAMS:
+        broker.publish(str(proj_id), task_event_payload(task_idx, done, photos))
+
+def watch_task_events(events):
+    pipeline = [{"$match": {"operationType": {"$in": ["insert", "update", "replace"]}}}]
+    while True:
+        try:
+            with events.watch(pipeline, full_document="updateLookup") as stream:
+                for change in stream:
+                    doc = change.get("fullDocument")
+                    if doc:
+                        broker.publish(str(doc["project_id"]), task_event_payload(
+                            doc["task_idx"], doc.get("done", False), len(doc.get("photos", []))))
+        except Exception as e:
+            logging.error(f"task_events change stream failed, retrying: {e}")
+            time.sleep(5)
+
+def ensure_change_stream_watcher():
+    global _watcher_started
+    if USE_CHANGE_STREAMS and not _watcher_started:
+        with _watcher_lock:
+            if not _watcher_started:
+                for shard, events in enumerate(events_col.shards()):
+                    threading.Thread(target=watch_task_events, args=(events,), name=f"task-events-watch-{shard}", daemon=True).start()
+                _watcher_started = True
+
+def sse(event):
+    return f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+
+def sse_clock():
+    # Lets the dashboard countdown correct for a skewed phone clock
+    return sse({"type": "clock", "now_ms": int(time.time() * 1000)})
+
+def sse_wait(rollover_at):
+    """Seconds to wait for an event before a heartbeat or the day rollover is due."""
+    return min(SSE_HEARTBEAT, max((rollover_at - datetime.datetime.now()).total_seconds(), 0))
+
+def sse_idle(rollover_at):
+    """Chunk to send after a quiet wait, and the next rollover time."""
+    if datetime.datetime.now() >= rollover_at:
+        return sse({"type": "rollover", "date": date.today().isoformat()}), next_day_start()
+    return ": keep-alive\n\n", rollover_at
+
+SSE_HEADERS = {
+    "Cache-Control": "no-cache",
+    "X-Accel-Buffering": "no",
+}
+
+def event_stream_key(pid):
+    """Broker key for one of the current user's projects; 404 for anything else."""
+    try:
+        proj_id = ObjectId(pid)
+    except bson_errors.InvalidId:
+        abort(404)
+    if not find_project(proj_id, session.get("user_id"), {"_id": 1}):
+        abort(404)
+    ensure_change_stream_watcher()
+    return str(proj_id)
+
+@app.route("/projects/<pid>/events")
+def project_events(pid):
+    if not live_events_enabled():
+        return Response(status=204)  # tells EventSource (e.g. on a cached page) not to reconnect
+    key = event_stream_key(pid)
+
+    def stream():
+        q = broker.subscribe(key)
+        try:
+            yield "retry: 5000\n\n" + sse_clock()
+            deadline = time.monotonic() + SSE_MAX_SECONDS
+            rollover_at = next_day_start()
+            while time.monotonic() < deadline:
+                try:
+                    yield sse(q.get(timeout=sse_wait(rollover_at)))
+                    continue
+                except queue.Empty:
+                    pass
+                chunk, rollover_at = sse_idle(rollover_at)
+                yield chunk
+        finally:
+            broker.unsubscribe(key, q)
+
+    return Response(stream(), mimetype="text/event-stream", headers=SSE_HEADERS)
+
+
 @app.route("/time-left")
 def time_left():
     return time_left_for_next_day_bangla()
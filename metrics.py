@@ -0,0 +1,137 @@
+"""In-process latency histograms and counters, rendered in Prometheus text format.
+
+Everything is per process: with several workers, scrape each one (or let
+Prometheus sum them). Quantiles are estimated from the bucket counts the same
+way Prometheus' histogram_quantile() does.
+"""
+import bisect
+import threading
+from pymongo import monitoring
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (1, 2, 3, 5, 8, 13, 21, 34, 55, 100)
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+class Histogram:
+    __slots__ = ("buckets", "counts", "total", "count")
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # last slot is +Inf
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.total += value
+        self.count += 1
+
+    def quantile(self, q):
+        """Linear interpolation inside the bucket holding the q-th observation."""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            if n and seen + n >= rank:
+                lower = self.buckets[i - 1] if i else 0.0
+                if i == len(self.buckets):
+                    return lower  # beyond the last bucket; best we can say
+                return lower + (self.buckets[i] - lower) * (rank - seen) / n
+            seen += n
+        return self.buckets[-1]
+
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._meta = {}  # name -> (kind, help, label names, buckets)
+        self._series = {}  # name -> {label values: Histogram | number}
+
+    def histogram(self, name, help, labels, buckets=LATENCY_BUCKETS):
+        self._meta[name] = ("histogram", help, labels, buckets)
+        self._series[name] = {}
+
+    def counter(self, name, help, labels):
+        self._meta[name] = ("counter", help, labels, None)
+        self._series[name] = {}
+
+    def observe(self, name, labels, value):
+        with self._lock:
+            series = self._series[name]
+            hist = series.get(labels)
+            if hist is None:
+                hist = series[labels] = Histogram(self._meta[name][3])
+            hist.observe(value)
+
+    def inc(self, name, labels, value=1):
+        with self._lock:
+            series = self._series[name]
+            series[labels] = series.get(labels, 0) + value
+
+    def render(self):
+        """Prometheus text exposition format (version 0.0.4)."""
+        lines = []
+        with self._lock:
+            for name, (kind, help, label_names, buckets) in self._meta.items():
+                lines.append(f"# HELP {name} {help}")
+                lines.append(f"# TYPE {name} {kind}")
+                for values, series in sorted(self._series[name].items()):
+                    labels = ",".join(f'{k}="{_escape(v)}"' for k, v in zip(label_names, values))
+                    if kind == "counter":
+                        lines.append(f"{name}{{{labels}}} {series}")
+                        continue
+                    sep = "," if labels else ""
+                    cumulative = 0
+                    for bound, n in zip(buckets + (float("inf"),), series.counts):
+                        cumulative += n
+                        le = "+Inf" if bound == float("inf") else repr(bound)
+                        lines.append(f'{name}_bucket{{{labels}{sep}le="{le}"}} {cumulative}')
+                    lines.append(f"{name}_sum{{{labels}}} {series.total}")
+                    lines.append(f"{name}_count{{{labels}}} {series.count}")
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self):
+        """Plain dict view with p50/p95/p99 per histogram series."""
+        out = {}
+        with self._lock:
+            for name, (kind, _, label_names, _) in self._meta.items():
+                rows = []
+                for values, series in sorted(self._series[name].items()):
+                    row = dict(zip(label_names, values))
+                    if kind == "counter":
+                        row["value"] = series
+                    else:
+                        row["count"] = series.count
+                        row["sum"] = round(series.total, 6)
+                        for q in QUANTILES:
+                            estimate = series.quantile(q)
+                            row[f"p{int(q * 100)}"] = None if estimate is None else round(estimate, 6)
+                    rows.append(row)
+                out[name] = rows
+        return out
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class CommandTimer(monitoring.CommandListener):
+    """pymongo listener that hands every finished command to ``record``.
+
+    ``record(command_name, seconds, failed)`` is called on the thread that ran
+    the command, so it can look at the current request.
+    """
+
+    def __init__(self, record):
+        self.record = record
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        self.record(event.command_name, event.duration_micros / 1e6, False)
+
+    def failed(self, event):
+        self.record(event.command_name, event.duration_micros / 1e6, True)
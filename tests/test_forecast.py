@@ -0,0 +1,39 @@
+"""Growth fit and threshold math behind the stored target and feed-level dates."""
+import os
+import sys
+
+import pytest
+
+np = pytest.importorskip("numpy")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import forecast  # noqa: E402
+
+
+def test_linear_series_recovers_its_slope():
+    days = [-30, -20, -10, 0, -15, -5]
+    weights = [100 + 1.5 * (d + 30) for d in days[:4]] + [20 + 0.2 * (d + 15) for d in days[4:]]
+    gain, weight_now = forecast.fit_growth([0, 0, 0, 0, 1, 1], days, weights, 3, default_gain=0.7)
+    assert gain[:2] == pytest.approx([1.5, 0.2])
+    assert weight_now[:2] == pytest.approx([145.0, 23.0])
+    # No readings: default gain, unknown weight
+    assert gain[2] == 0.7 and np.isnan(weight_now[2])
+
+
+def test_single_reading_falls_back_to_default_gain():
+    gain, weight_now = forecast.fit_growth([0, 1, 1], [-3, -4, -4], [50, 20, 22], 2,
+                                           default_gain=np.array([1.0, 0.1]))
+    assert list(gain) == [1.0, 0.1]
+    assert weight_now[0] == pytest.approx(53.0)
+    assert weight_now[1] == pytest.approx(21.0 + 0.4)
+
+
+def test_next_threshold_at_and_above_the_top_bracket():
+    level, boundary = forecast.next_threshold(np.array([100.0, 150.0, 280.0, 400.0]), [150, 280])
+    assert list(level) == [2, 3, 0, 0]
+    assert list(boundary) == [150, 280, np.inf, np.inf]
+
+
+def test_days_until_without_positive_gain():
+    days = forecast.days_until(np.array([100.0, 100.0, 300.0]), np.array([0.0, -0.5, 0.0]), 280)
+    assert list(days) == [np.inf, np.inf, 0.0]
+    assert forecast.days_until(np.array([100.0]), np.array([2.0]), 280)[0] == pytest.approx(90.0)
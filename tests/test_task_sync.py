@@ -0,0 +1,144 @@
+"""Offline task sync: photo reference counts and idempotency-key release.
+
+Runs against mongomock (pip install pytest mongomock); no MongoDB needed.
+"""
+import datetime
+import io
+import os
+import sys
+import uuid
+
+import pytest
+
+mongomock = pytest.importorskip("mongomock")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import index  # noqa: E402
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    monkeypatch.setattr(index, "MongoClient", mongomock.MongoClient)
+    monkeypatch.setattr(index, "MONGO_DB", f"test_{uuid.uuid4().hex}")
+    monkeypatch.setattr(index, "_clients", {})
+    monkeypatch.setattr(index, "UPLOAD_GC_INTERVAL", 0)
+    uploads = tmp_path / "uploads"
+    monkeypatch.setattr(index, "UPLOAD_FOLDER", str(uploads))
+    monkeypatch.setattr(index, "UPLOAD_TMP_FOLDER", str(uploads / ".tmp"))
+    monkeypatch.setattr(index, "THUMB_FOLDER", str(uploads / "thumbs"))
+    monkeypatch.setattr(index, "_upload_dirs_ready", False)
+    monkeypatch.setattr(index, "Image", None)  # no thumbnails needed here
+    index.migrate()
+    index.app.config["TESTING"] = True
+    return index.app
+
+
+def login(app, role="user"):
+    user_id = index.users_col.insert_one({"email": f"{uuid.uuid4().hex}@test", "name": "T", "role": role}).inserted_id
+    client = app.test_client()
+    with client.session_transaction() as sess:
+        sess["user_id"] = str(user_id)
+        sess["role"] = role
+    return client, str(user_id)
+
+
+def new_project(client, owner, name):
+    client.post("/projects/new", data={"name": name, "type": "cow", "purchase_date": "2024-01-01", "weight": "100"})
+    return index.proj_col.for_owner(owner).find_one({"owner": owner, "name": name})["_id"]
+
+
+def photo(content=b"photo"):
+    return (io.BytesIO(b"\xff\xd8\xff" + content), "photo.jpg")
+
+
+def references():
+    counts = {}
+    for events in index.events_col.shards():
+        for event in events.find({"photos.0": {"$exists": True}}):
+            for name in event["photos"]:
+                counts[name] = counts.get(name, 0) + 1
+    return counts
+
+
+def assert_refcounts_match():
+    refs = references()
+    blobs = {b["_id"]: b.get("refs", 0) for b in index.blobs_col.find()}
+    for name, count in refs.items():
+        assert blobs.get(name) == count, name
+        assert os.path.exists(os.path.join(index.UPLOAD_FOLDER, name)), name
+
+
+def sync(client, key, items):
+    return client.post("/projects/tasks/sync", json={"idempotency_key": key, "items": items})
+
+
+def test_synced_photo_keeps_shared_file_alive(app):
+    client, owner = login(app)
+    project_a, project_b = new_project(client, owner, "A"), new_project(client, owner, "B")
+    client.post(f"/projects/{project_a}/photos/upload", data={"task_idx": "0", "photos": photo()},
+                content_type="multipart/form-data")
+    name = index.events_col.for_owner(owner).find_one({"project_id": project_a})["photos"][0]
+
+    # The device skipped the upload (HEAD showed the file) and syncs the same name to B
+    assert sync(client, "sync-key-0001", [{"project_id": str(project_b), "task_idx": 0, "photos": [name]}]).status_code == 200
+    assert index.blobs_col.find_one({"_id": name})["refs"] == 2
+    assert_refcounts_match()
+
+    # Syncing a name the event already has adds no reference
+    sync(client, "sync-key-0002", [{"project_id": str(project_b), "task_idx": 0, "photos": [name]}])
+    assert index.blobs_col.find_one({"_id": name})["refs"] == 2
+
+    # Unchecking A's task drops A's reference only
+    admin, _ = login(app, role="admin")
+    admin.post(f"/admin/projects/{project_a}/edit", data={"name": "A", "type": "cow", "purchase_date": "2024-01-01", "weight": "100"})
+    assert index.blobs_col.find_one({"_id": name})["refs"] == 1
+    assert_refcounts_match()
+
+
+def test_batch_upload_is_referenced_by_its_sync(app):
+    client, owner = login(app)
+    project = new_project(client, owner, "A")
+    names = client.post("/projects/photos", data={"photos": photo(b"batch")},
+                        content_type="multipart/form-data").get_json()["photos"]
+    assert index.blobs_col.find_one({"_id": names[0]})["refs"] == 0
+
+    # Two items for the same task in one batch take one reference
+    items = [{"project_id": str(project), "task_idx": 1, "photos": names}] * 2
+    assert sync(client, "sync-key-0003", items).get_json()["applied"] == 2
+    assert index.blobs_col.find_one({"_id": names[0]})["refs"] == 1
+    assert_refcounts_match()
+
+
+def test_failed_sync_releases_its_key(app, monkeypatch):
+    client, owner = login(app)
+    project = new_project(client, owner, "A")
+    items = [{"project_id": str(project), "task_idx": 0}]
+
+    def fail(*args, **kwargs):
+        raise RuntimeError("boom")
+
+    # Any failure after the key is claimed, not just in the events write
+    with monkeypatch.context() as m:
+        m.setattr(index, "schedule_task_count", fail)
+        assert sync(client, "sync-key-0004", items).status_code == 503
+    assert index.sync_col.find_one({"_id": f"{owner}:sync-key-0004"}) is None
+
+    retry = sync(client, "sync-key-0004", items)
+    assert retry.status_code == 200 and retry.get_json()["applied"] == 1
+
+
+def test_abandoned_claim_is_taken_over(app):
+    client, owner = login(app)
+    project = new_project(client, owner, "A")
+    items = [{"project_id": str(project), "task_idx": 0}]
+
+    # A worker claimed the key and died before storing the response
+    claimed = datetime.datetime.utcnow()
+    index.sync_col.insert_one({"_id": f"{owner}:sync-key-0005", "fingerprint": index.content_version(items),
+                               "created": claimed, "claimed_at": claimed})
+    assert sync(client, "sync-key-0005", items).status_code == 409
+
+    stale = claimed - datetime.timedelta(seconds=index.SYNC_CLAIM_TIMEOUT + 1)
+    index.sync_col.update_one({"_id": f"{owner}:sync-key-0005"}, {"$set": {"claimed_at": stale}})
+    retry = sync(client, "sync-key-0005", items)
+    assert retry.status_code == 200 and retry.get_json()["applied"] == 1
+    assert "response" in index.sync_col.find_one({"_id": f"{owner}:sync-key-0005"})